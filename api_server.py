@@ -1,161 +1,166 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Request, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
+from PIL import UnidentifiedImageError
+from werkzeug.exceptions import RequestEntityTooLarge
 import cv2
-import imagehash
-from PIL import Image
 import pandas as pd
 import os
 import io
+import json
+import time
+import zipfile
+from cardscanner.batchhash import hash_batch
+from cardscanner.cardstore import CardStore
+from cardscanner.decode import MAX_UPLOAD_BYTES, ImageTooLarge, decode_image
+from cardscanner.hashpool import HashPool, PoolBusy, server_timing
+from cardscanner.localize import localize_image
+from cardscanner.reloader import ReloadingMatcher
+from cardscanner.scancache import ScanCache, digest_stream
+from cardscanner.searchindex import QuerySyntaxError, SyncedSearchIndex
+from cardscanner.sharedindex import load_shared_index
+from pokemontcgmanager.cache import ResponseCache
 from pokemontcgmanager.card import Card
+from pokemontcgmanager.restclient import RestClient
+
+class ScanRequest(Request):
+    """
+    Request whose body limit depends on the route.
+    
+    Every route accepts a single upload (MAX_CONTENT_LENGTH); only batch
+    scans may carry up to MAX_BATCH_BYTES. Werkzeug enforces the limit
+    while reading the body, chunked uploads included.
+    """
+    @property
+    def max_content_length(self):
+        if self.endpoint == 'scan_cards':
+            return MAX_BATCH_BYTES
+        return super().max_content_length
 
 app = Flask(__name__)
+app.request_class = ScanRequest
 CORS(app)  # Enable CORS for mobile app integration
 
-# Load the card hash database
-card_hashes = pd.read_pickle("card_hashes_32b.pickle")
+# Memory-map the card hash database (CARD_HASH_DB, falling back to card_hashes_32b.pickle)
+# into a read-only matcher shared by all request threads, reloaded when the files change.
+# Worker processes map the same shared snapshot instead of loading their own copy.
+card_matcher = ReloadingMatcher(loader=load_shared_index)
 
-def preprocess_image(img: Image) -> Image:
-    """
-    Preprocess image for better hash comparison.
+# Cache upstream API responses in memory, and on disk when POKEMONTCG_CACHE_PATH is set
+RestClient.configure(cache=ResponseCache(disk_path=os.environ.get('POKEMONTCG_CACHE_PATH')))
+
+# Worker processes that decode and hash scans (HASH_POOL_WORKERS, 0 to hash on the request thread)
+hash_pool = HashPool()
+
+# Recent scan results, by upload digest and by near-identical hash
+scan_cache = ScanCache()
+
+# Local card metadata, filled by `python -m cardscanner.cardstore sync`
+card_store = CardStore()
+
+# Offline search over the synced catalog, used instead of the API once a full sync has completed
+search_index = SyncedSearchIndex(card_store)
+
+# Most images accepted by a single /api/scans request
+MAX_BATCH_IMAGES = int(os.environ.get('MAX_BATCH_IMAGES', 50))
+
+# Most bytes the images of a single /api/scans request may take, uncompressed
+MAX_BATCH_BYTES = int(os.environ.get('MAX_BATCH_BYTES', 200 * 1024 * 1024))
+
+# Most cards a single /api/scan request may look for in its image
+MAX_CARDS_PER_SCAN = int(os.environ.get('MAX_CARDS_PER_SCAN', 8))
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+# Hash types a scan may ask for, besides 'fused' (see scan_hash_types)
+HASH_TYPES = ['perceptual', 'difference', 'wavelet']
+
+# Request bodies are limited to a single upload, except for batch scans (see ScanRequest)
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
+
+def scan_hash_types(matcher):
     """
-    # Convert to RGB if needed
-    if img.mode != 'RGB':
-        img = img.convert('RGB')
-    
-    # Resize to standard card dimensions (maintain aspect ratio)
-    target_width = 600
-    target_height = 825
+    Get the hash types scans can use with a matcher.
     
-    # Calculate resize ratio to maintain aspect ratio
-    img_ratio = img.width / img.height
-    target_ratio = target_width / target_height
-    
-    if img_ratio > target_ratio:
-        # Image is wider, fit to height
-        new_height = target_height
-        new_width = int(target_height * img_ratio)
-    else:
-        # Image is taller, fit to width
-        new_width = target_width
-        new_height = int(target_width / img_ratio)
-    
-    img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-    
-    # Crop to target dimensions if larger
-    if new_width > target_width or new_height > target_height:
-        left = (new_width - target_width) // 2
-        top = (new_height - target_height) // 2
-        right = left + target_width
-        bottom = top + target_height
-        img = img.crop((left, top, right, bottom))
+    'fused' is only offered when the index holds at least one of the cascade's hash types.
+    """
+    return HASH_TYPES + (['fused'] if matcher.fused_hash_types else [])
+
+def find_card(card_id):
+    """
+    Get raw card data from the local card store, falling back to the Pokemon TCG API on a miss.
     
-    return img
+    Cards stored longer than CARD_STORE_MAX_AGE ago are fetched again, so prices stay current,
+    unless the API can't be reached.
+    """
+    return card_store.find(card_id)
 
-def get_hashes(img: Image) -> dict:
+def find_cards(card_ids):
     """
-    Calculate various types of hashes for an image.
+    Get raw card data for several cards at once.
+    
+    Cards missing from the local card store, or expired in it, are fetched from the Pokemon
+    TCG API concurrently. Expired cards that could not be fetched are returned as stored.
+    Returns a dict keyed by card id, without cards that could not be found at all.
     """
-    # Preprocess the image first
-    img = preprocess_image(img)
+    return card_store.find_many(card_ids)
+
+def search_page(query, page, page_size):
+    """
+    Get one page of search results from the local search index, falling back to the Pokemon TCG API.
     
-    perceptual = imagehash.phash(img, 32, 8)
-    difference = imagehash.dhash(img, 32)
-    wavelet = imagehash.whash(img, 32)
-    color = imagehash.colorhash(img)
-    return {
-        "perceptual": perceptual,
-        "difference": difference,
-        "wavelet": wavelet,
-        "color": color,
-    }
+    Returns the page and where it came from ('local' or 'remote').
+    """
+    # Only a completely synced catalog can answer searches, a partial one would miss cards
+    index = search_index.current()
+    if index is not None:
+        try:
+            return index.search(query, page, page_size), 'local'
+        except QuerySyntaxError:
+            pass
+    return Card.page(q=query, page=page, page_size=page_size, prefetch=True), 'remote'
 
-def get_most_similar(img: Image, hash_type="perceptual", n=5):
+def format_card_details(card):
     """
-    Find the most similar Pokémon card based on image hash.
+    Build the card details returned by the API from raw Pokemon TCG API card data.
     """
-    hashes_dict = get_hashes(img)
-    
-    # Calculate distances for all hash types
-    distances = {}
-    for hash_name in ["perceptual", "difference", "wavelet"]:
-        if hash_name in card_hashes.columns:
-            card_hashes[f"{hash_name}_distance"] = card_hashes[hash_name] - hashes_dict[hash_name]
-            card_hashes[f"{hash_name}_distance"] = card_hashes[f"{hash_name}_distance"].astype("int")
-            distances[hash_name] = card_hashes[f"{hash_name}_distance"]
-    
-    # Use the specified hash type as primary
-    primary_distance = distances.get(hash_type, distances["perceptual"])
-    
-    # Calculate confidence score (lower distance = higher confidence)
-    max_distance = primary_distance.max()
-    confidence_scores = 1 - (primary_distance / max_distance)
-    
-    # Filter for high confidence matches (distance < 50% of max)
-    high_confidence_mask = primary_distance < (max_distance * 0.5)
-    
-    if high_confidence_mask.sum() > 0:
-        # Use only high confidence matches
-        filtered_hashes = card_hashes[high_confidence_mask]
-        filtered_distances = primary_distance[high_confidence_mask]
-        filtered_confidence = confidence_scores[high_confidence_mask]
-    else:
-        # If no high confidence matches, use all
-        filtered_hashes = card_hashes
-        filtered_distances = primary_distance
-        filtered_confidence = confidence_scores
-    
-    # Sort by distance (lowest first)
-    sorted_indices = filtered_distances.argsort()
-    
-    if n > 1:
-        top_indices = sorted_indices[:n]
-        similar_ids = filtered_hashes.iloc[top_indices]["id"].tolist()
-        confidences = filtered_confidence.iloc[top_indices].tolist()
-        return similar_ids, confidences
-    else:
-        best_index = sorted_indices[0]
-        similar_id = filtered_hashes.iloc[best_index]["id"]
-        confidence = filtered_confidence.iloc[best_index]
-        return similar_id, confidence
+    return {
+        'id': card.get('id'),
+        'name': card.get('name'),
+        'set': {
+            'name': card.get('set', {}).get('name'),
+            'series': card.get('set', {}).get('series'),
+            'printedTotal': card.get('set', {}).get('printedTotal')
+        },
+        'number': card.get('number'),
+        'images': card.get('images'),
+        'cardmarket': card.get('cardmarket'),
+        'tcgplayer': card.get('tcgplayer'),
+        'rarity': card.get('rarity'),
+        'types': card.get('types'),
+        'attacks': card.get('attacks'),
+        'weaknesses': card.get('weaknesses'),
+        'resistances': card.get('resistances'),
+        'retreatCost': card.get('retreatCost'),
+        'convertedRetreatCost': card.get('convertedRetreatCost'),
+        'hp': card.get('hp'),
+        'supertype': card.get('supertype'),
+        'subtypes': card.get('subtypes'),
+        'level': card.get('level'),
+        'evolvesFrom': card.get('evolvesFrom'),
+        'evolvesTo': card.get('evolvesTo'),
+        'rules': card.get('rules'),
+        'abilities': card.get('abilities'),
+        'flavorText': card.get('flavorText'),
+        'nationalPokedexNumbers': card.get('nationalPokedexNumbers'),
+        'legalities': card.get('legalities'),
+        'regulationMark': card.get('regulationMark')
+    }
 
 def get_card_details(card_id):
     """
-    Get detailed card information from Pokemon TCG API.
+    Get detailed card information from the local card store or the Pokemon TCG API.
     """
     try:
-        card = Card.find(card_id)
-        return {
-            'id': card.get('id'),
-            'name': card.get('name'),
-            'set': {
-                'name': card.get('set', {}).get('name'),
-                'series': card.get('set', {}).get('series'),
-                'printedTotal': card.get('set', {}).get('printedTotal')
-            },
-            'number': card.get('number'),
-            'images': card.get('images'),
-            'cardmarket': card.get('cardmarket'),
-            'tcgplayer': card.get('tcgplayer'),
-            'rarity': card.get('rarity'),
-            'types': card.get('types'),
-            'attacks': card.get('attacks'),
-            'weaknesses': card.get('weaknesses'),
-            'resistances': card.get('resistances'),
-            'retreatCost': card.get('retreatCost'),
-            'convertedRetreatCost': card.get('convertedRetreatCost'),
-            'hp': card.get('hp'),
-            'supertype': card.get('supertype'),
-            'subtypes': card.get('subtypes'),
-            'level': card.get('level'),
-            'evolvesFrom': card.get('evolvesFrom'),
-            'evolvesTo': card.get('evolvesTo'),
-            'rules': card.get('rules'),
-            'abilities': card.get('abilities'),
-            'flavorText': card.get('flavorText'),
-            'nationalPokedexNumbers': card.get('nationalPokedexNumbers'),
-            'legalities': card.get('legalities'),
-            'regulationMark': card.get('regulationMark')
-        }
+        return format_card_details(find_card(card_id))
     except Exception as e:
         return {'error': f'Failed to fetch card details: {str(e)}'}
 
@@ -165,7 +170,10 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'message': 'Pokemon Card Scanner API is running',
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'upstream_cache': RestClient.cache.stats(),
+        'hash_index': card_matcher.status(),
+        'scan_cache': scan_cache.stats()
     })
 
 @app.route('/api/scan', methods=['POST'])
@@ -175,10 +183,18 @@ def scan_card():
     
     Expected request:
     - multipart/form-data with 'image' file
-    - Optional 'hash_type' parameter (perceptual, difference, wavelet)
+    - Optional 'hash_type' parameter (perceptual, difference, wavelet, fused)
     - Optional 'num_results' parameter (default: 5)
+    - Optional 'max_cards' parameter, cards to look for in the image (default: 1)
     """
     try:
+        if request.content_length and request.content_length > MAX_UPLOAD_BYTES:
+            return jsonify({
+                'error': 'Image too large',
+                'message': f'Uploads are limited to {MAX_UPLOAD_BYTES} bytes',
+                'success': False
+            }), 413
+        
         # Check if image file is present
         if 'image' not in request.files:
             return jsonify({
@@ -196,42 +212,100 @@ def scan_card():
         # Get parameters
         hash_type = request.form.get('hash_type', 'perceptual')
         num_results = int(request.form.get('num_results', 5))
+        max_cards = min(max(int(request.form.get('max_cards', 1)), 1), MAX_CARDS_PER_SCAN)
         
         # Validate hash type
-        valid_hash_types = ['perceptual', 'difference', 'wavelet']
+        matcher, generation = card_matcher.snapshot()
+        valid_hash_types = scan_hash_types(matcher)
         if hash_type not in valid_hash_types:
             return jsonify({
                 'error': 'Invalid hash type',
                 'message': f'Hash type must be one of: {", ".join(valid_hash_types)}'
             }), 400
         
-        # Read and process image
-        img_data = file.read()
-        img = Image.open(io.BytesIO(img_data))
+        # Exact re-uploads are answered from the scan cache without decoding them
+        variant = (hash_type, num_results, max_cards)
+        start = time.perf_counter()
+        digest = digest_stream(file.stream)
+        cached = scan_cache.get(digest, variant, generation)
+        timings = {'cache': time.perf_counter() - start}
+        if cached is not None:
+            return scan_response(cached, 'HIT', timings)
+        
+        # Decode the image, find the cards in it and hash them in the hash pool, off the request thread
+        hash_types = matcher.fused_hash_types if hash_type == 'fused' else (hash_type,)
+        try:
+            detected, hash_timings = hash_pool.hash_cards(file.stream, hash_types, max_cards)
+        except PoolBusy as e:
+            return jsonify({
+                'error': 'Server busy',
+                'message': str(e),
+                'success': False
+            }), 503, {'Retry-After': str(e.retry_after)}
+        timings.update(hash_timings)
+        hashes, corners = detected[0]
+        
+        # Near-identical frames of a recent scan get its result
+        # The fused cascade's first hash type is the one it shortlists by, and always computed
+        cache_hash_type = matcher.fused_hash_types[0] if hash_type == 'fused' else hash_type
+        if max_cards == 1:
+            cached = scan_cache.get_near(hashes[cache_hash_type], variant, generation)
+            if cached is not None:
+                scan_cache.put(digest, variant, hashes[cache_hash_type], generation, cached)
+                return scan_response(cached, 'HIT-NEAR', timings)
         
         # Get similar cards
-        similar_ids, confidences = get_most_similar(img, hash_type, num_results)
+        start = time.perf_counter()
+        match_lists = [matcher.most_similar(card_hashes, hash_type, num_results) for card_hashes, _ in detected]
+        timings['match'] = time.perf_counter() - start
         
-        # Get detailed card information
-        cards = []
-        for i, card_id in enumerate(similar_ids):
-            card_details = get_card_details(card_id)
-            if 'error' not in card_details:
-                card_details['confidence'] = confidences[i] if isinstance(confidences, list) else confidences
-                cards.append(card_details)
+        # Get detailed card information, fetching all matches of all cards concurrently
+        start = time.perf_counter()
+        found = find_cards([card_id for matches in match_lists for card_id, _ in matches])
+        detections = []
+        for (_, card_corners), matches in zip(detected, match_lists):
+            cards = [
+                dict(format_card_details(found[card_id]), confidence=confidence)
+                for card_id, confidence in matches
+                if card_id in found
+            ]
+            detections.append({
+                'card_corners': card_corners,
+                'primary_match': cards[0] if cards else None,
+                'all_matches': cards,
+            })
+        timings['details'] = time.perf_counter() - start
+        cards = detections[0]['all_matches']
         
         # Prepare response
-        response = {
+        result = {
             'success': True,
             'hash_type_used': hash_type,
             'num_results': len(cards),
             'primary_match': cards[0] if cards else None,
             'all_matches': cards,
-            'scan_timestamp': pd.Timestamp.now().isoformat()
+            'card_corners': corners,
         }
+        if max_cards > 1:
+            result['detections'] = detections
+        # A scan without card details most likely hit an upstream error, so it isn't cached
+        if cards:
+            scan_cache.put(digest, variant, hashes[cache_hash_type], generation, result)
         
-        return jsonify(response)
+        return scan_response(result, 'MISS', timings)
         
+    except RequestEntityTooLarge:
+        return jsonify({
+            'error': 'Image too large',
+            'message': f'Uploads are limited to {MAX_UPLOAD_BYTES} bytes',
+            'success': False
+        }), 413
+    except ImageTooLarge as e:
+        return jsonify({
+            'error': 'Image too large',
+            'message': str(e),
+            'success': False
+        }), 413
     except Exception as e:
         return jsonify({
             'error': 'Scan failed',
@@ -239,6 +313,181 @@ def scan_card():
             'success': False
         }), 500
 
+def scan_response(result, cache_status, timings):
+    """
+    Build the response of a scan from its (possibly cached) result.
+    """
+    response = jsonify(dict(result, scan_timestamp=pd.Timestamp.now().isoformat()))
+    response.headers['X-Cache'] = cache_status
+    response.headers['Server-Timing'] = server_timing(timings)
+    return response
+
+def read_batch_images():
+    """
+    Collect the images of a batch scan request.
+    
+    Images come either as several 'images' files or as one zip 'archive'.
+    Returns a list of (filename, PIL.Image or None, error message or None).
+    """
+    items = []
+    archive = request.files.get('archive')
+    if archive is not None and archive.filename != '':
+        with zipfile.ZipFile(archive.stream) as zf:
+            members = sorted(
+                (info for info in zf.infolist()
+                 if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS)),
+                key=lambda info: info.filename
+            )[:MAX_BATCH_IMAGES + 1]
+            # Sizes are checked before anything is decompressed, so a zip bomb can't fill the memory
+            total = sum(info.file_size for info in members if info.file_size <= MAX_UPLOAD_BYTES)
+            if total > MAX_BATCH_BYTES:
+                raise RequestEntityTooLarge(f'The images of a batch may take at most {MAX_BATCH_BYTES} bytes uncompressed')
+            for info in members:
+                data = None
+                if info.file_size <= MAX_UPLOAD_BYTES:
+                    with zf.open(info) as member:
+                        data = member.read(MAX_UPLOAD_BYTES + 1)
+                # Oversized members are reported like unreadable images
+                items.append((info.filename, io.BytesIO(data) if data and len(data) <= MAX_UPLOAD_BYTES else None))
+    else:
+        for file in request.files.getlist('images'):
+            if file.filename != '':
+                items.append((file.filename, file.stream))
+    
+    images = []
+    for filename, stream in items:
+        if stream is None:
+            images.append((filename, None, f'Image too large: uploads are limited to {MAX_UPLOAD_BYTES} bytes'))
+            continue
+        try:
+            # Only grayscale hashes are computed, so JPEGs only decode their luma,
+            # and each image is hashed as the largest card found in it
+            img, _ = localize_image(decode_image(stream, 'L'))[0]
+            images.append((filename, img, None))
+        except UnidentifiedImageError:
+            # PIL's message only names the upload stream object
+            images.append((filename, None, f'Could not read image {filename}: not a supported image file'))
+        except Exception as e:
+            images.append((filename, None, f'Could not read image {filename}: {str(e)}'))
+    return images
+
+@app.route('/api/scans', methods=['POST'])
+def scan_cards():
+    """
+    Scan several Pokemon card images in one request.
+    
+    Expected request:
+    - multipart/form-data with several 'images' files, or one zip 'archive' of images
+    - Optional 'hash_type' parameter (perceptual, difference, wavelet, fused)
+    - Optional 'num_results' parameter per image (default: 5)
+    - Optional 'stream' parameter; when true (or when the client accepts
+      application/x-ndjson) results are streamed as one JSON line per image
+    """
+    try:
+        hash_type = request.form.get('hash_type', 'perceptual')
+        num_results = int(request.form.get('num_results', 5))
+        stream = (
+            request.form.get('stream', '').lower() in ('1', 'true', 'yes')
+            or 'application/x-ndjson' in request.headers.get('Accept', '')
+        )
+        
+        # The whole batch is matched on one index generation
+        matcher = card_matcher.current
+        valid_hash_types = scan_hash_types(matcher)
+        if hash_type not in valid_hash_types:
+            return jsonify({
+                'error': 'Invalid hash type',
+                'message': f'Hash type must be one of: {", ".join(valid_hash_types)}'
+            }), 400
+        
+        images = read_batch_images()
+        if not images:
+            return jsonify({
+                'error': 'No image files provided',
+                'message': 'Please include image files or a zip archive in the request'
+            }), 400
+        if len(images) > MAX_BATCH_IMAGES:
+            return jsonify({
+                'error': 'Too many images',
+                'message': f'A batch scan accepts at most {MAX_BATCH_IMAGES} images'
+            }), 413
+        
+        # Hash every readable image together and match them against the index in one pass
+        readable = [img for _, img, error in images if error is None]
+        if hash_type == 'fused':
+            queries = hash_batch(readable, matcher.fused_hash_types)
+        else:
+            queries = hash_batch(readable, (hash_type,))[hash_type]
+        match_lists = matcher.most_similar_many(queries, hash_type, num_results) if readable else []
+        matches = iter(match_lists)
+        
+        # Each distinct card is only looked up once across the whole batch
+        details_cache = {}
+        def lookup_details(card_ids):
+            missing = [card_id for card_id in card_ids if card_id not in details_cache]
+            if missing:
+                found = find_cards(missing)
+                for card_id in missing:
+                    details_cache[card_id] = format_card_details(found[card_id]) if card_id in found else None
+            return details_cache
+        
+        def results():
+            for index, (filename, _, error) in enumerate(images):
+                if error is not None:
+                    yield {'index': index, 'filename': filename, 'success': False, 'error': error}
+                    continue
+                image_matches = next(matches)
+                details = lookup_details([card_id for card_id, _ in image_matches])
+                cards = [
+                    dict(details[card_id], confidence=confidence)
+                    for card_id, confidence in image_matches
+                    if details[card_id] is not None
+                ]
+                yield {
+                    'index': index,
+                    'filename': filename,
+                    'success': True,
+                    'num_results': len(cards),
+                    'primary_match': cards[0] if cards else None,
+                    'all_matches': cards,
+                }
+        
+        if stream:
+            lines = (json.dumps(result) + '\n' for result in results())
+            return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+        
+        # Without streaming, every distinct match is fetched in one concurrent fan-out
+        lookup_details([card_id for image_matches in match_lists for card_id, _ in image_matches])
+        all_results = list(results())
+        return jsonify({
+            'success': True,
+            'hash_type_used': hash_type,
+            'num_images': len(all_results),
+            'results': all_results,
+            'scan_timestamp': pd.Timestamp.now().isoformat()
+        })
+        
+    except RequestEntityTooLarge as e:
+        if e.description == RequestEntityTooLarge.description:
+            e.description = f'Batch uploads are limited to {MAX_BATCH_BYTES} bytes'
+        return jsonify({
+            'error': 'Request too large',
+            'message': e.description,
+            'success': False
+        }), 413
+    except zipfile.BadZipFile as e:
+        return jsonify({
+            'error': 'Invalid archive',
+            'message': f'Could not read the zip archive: {str(e)}',
+            'success': False
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'error': 'Batch scan failed',
+            'message': str(e),
+            'success': False
+        }), 500
+
 @app.route('/api/card/<card_id>', methods=['GET'])
 def get_card(card_id):
     """
@@ -282,15 +531,13 @@ def search_cards():
                 'message': 'Please provide a search query parameter'
             }), 400
         
-        # Search using Pokemon TCG API
-        response = Card.where(q=query, pageSize=page_size, page=page)
+        # Search the local index, or the Pokemon TCG API for queries it can't answer
+        response, source = search_page(query, page, page_size)
+        if source == 'remote':
+            card_store.put_many(response)
         
-        # Convert to list of card details
-        cards = []
-        for card in response:
-            card_details = get_card_details(card.get('id'))
-            if 'error' not in card_details:
-                cards.append(card_details)
+        # The search response already holds the full card data, no need to fetch each card again
+        cards = [format_card_details(card) for card in response]
         
         return jsonify({
             'success': True,
@@ -298,6 +545,9 @@ def search_cards():
             'page': page,
             'page_size': page_size,
             'total_results': len(cards),
+            'total_count': response.total_count,
+            'last_page': response.last_page,
+            'source': source,
             'cards': cards
         })
         
@@ -308,14 +558,34 @@ def search_cards():
             'success': False
         }), 500
 
+@app.route('/api/search/suggest', methods=['GET'])
+def suggest_cards():
+    """
+    Typeahead suggestions of card names from the local search index.
+    
+    Query parameters:
+    - q: start of a card name
+    - limit: most suggestions to return (default: 10)
+    """
+    prefix = request.args.get('q', '')
+    limit = int(request.args.get('limit', 10))
+    return jsonify({
+        'success': True,
+        'query': prefix,
+        'suggestions': search_index.suggest(prefix, limit)
+    })
+
 @app.route('/api/hash-types', methods=['GET'])
 def get_hash_types():
     """
     Get available hash types and their descriptions.
+    
+    'fused' is left out when the loaded hash index has none of its hash types.
     """
+    available = scan_hash_types(card_matcher.current)
     return jsonify({
         'success': True,
-        'hash_types': {
+        'hash_types': {name: info for name, info in {
             'perceptual': {
                 'name': 'Perceptual Hash',
                 'description': 'Analyzes overall visual structure and patterns. Best for overall similarity and lighting variations.',
@@ -330,8 +600,13 @@ def get_hash_types():
                 'name': 'Wavelet Hash',
                 'description': 'Uses wavelet transforms to analyze image at different scales. Best for pattern recognition.',
                 'best_for': 'Pattern recognition, artwork details, textures'
+            },
+            'fused': {
+                'name': 'Fused Cascade',
+                'description': 'Shortlists cards by difference hash, then re-ranks them by a weighted mix of wavelet and perceptual distances. Confidence is calibrated on distance alone.',
+                'best_for': 'Best accuracy per scan, comparable confidence scores'
             }
-        }
+        }.items() if name in available}
     })
 
 if __name__ == '__main__':
@@ -340,8 +615,10 @@ if __name__ == '__main__':
     print("📱 Ready for mobile app integration!")
     print("🌐 API endpoints:")
     print("   - POST /api/scan - Scan a card image")
+    print("   - POST /api/scans - Scan several card images")
     print("   - GET  /api/card/<id> - Get card details")
     print("   - GET  /api/search - Search cards")
+    print("   - GET  /api/search/suggest - Card name suggestions")
     print("   - GET  /api/health - Health check")
     print("   - GET  /api/hash-types - Available hash types")
     
@@ -1,13 +1,22 @@
 from flask import Flask, render_template, request, Response, redirect, url_for
 import cv2
-import imagehash
+import json
+import time
 from PIL import Image
-import pandas as pd
 from urllib.parse import urlparse, parse_qs
 import os
-import io
 
+from cardscanner.camera import DEFAULT_JPEG_QUALITY, DEFAULT_STREAM_FPS, CameraFeed
+from cardscanner.cardstore import CardStore
+from cardscanner.decode import MAX_UPLOAD_BYTES, ImageTooLarge, decode_image
+from cardscanner.hashing import get_hashes
+from cardscanner.livescan import DEFAULT_HASH_TYPE as LIVE_SCAN_HASH_TYPE, LiveRecognizer
+from cardscanner.localize import localize_image
+from cardscanner.reloader import ReloadingMatcher
+from cardscanner.searchindex import QuerySyntaxError, SyncedSearchIndex
+from pokemontcgmanager.cache import ResponseCache
 from pokemontcgmanager.card import Card
+from pokemontcgmanager.restclient import RestClient
 
 
 # Helper Functions
@@ -28,72 +37,54 @@ def print_stats(card: dict):
     )
 
 
-def preprocess_image(img: Image) -> Image:
+def find_card(card_id: str) -> dict:
     """
-    Preprocess image for better hash comparison.
-    
+    Get a card from the local card store, falling back to the Pokémon TCG API when it is missing or expired.
+
     Args:
-        img (PIL.Image): Input image
-        
+        card_id (str): Card id.
+
     Returns:
-        PIL.Image: Preprocessed image
+        dict: Card data as returned by the Pokémon TCG API, as stored if it expired and the API can't be reached.
     """
-    # Convert to RGB if needed
-    if img.mode != 'RGB':
-        img = img.convert('RGB')
-    
-    # Resize to standard card dimensions (maintain aspect ratio)
-    target_width = 600
-    target_height = 825
-    
-    # Calculate resize ratio to maintain aspect ratio
-    img_ratio = img.width / img.height
-    target_ratio = target_width / target_height
-    
-    if img_ratio > target_ratio:
-        # Image is wider, fit to height
-        new_height = target_height
-        new_width = int(target_height * img_ratio)
-    else:
-        # Image is taller, fit to width
-        new_width = target_width
-        new_height = int(target_width / img_ratio)
-    
-    img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-    
-    # Crop to target dimensions if larger
-    if new_width > target_width or new_height > target_height:
-        left = (new_width - target_width) // 2
-        top = (new_height - target_height) // 2
-        right = left + target_width
-        bottom = top + target_height
-        img = img.crop((left, top, right, bottom))
-    
-    return img
+    return card_store.find(card_id)
+
 
-def get_hashes(img: Image) -> dict:
+def find_cards(card_ids: list) -> list:
     """
-    Calculate various types of hashes for an image.
+    Get several cards at once, fetching the ones missing or expired in the local card store concurrently.
 
     Args:
-        img (PIL.Image): Image to calculate hashes for.
+        card_ids (list): Card ids.
 
     Returns:
-        dict: Dictionary with various hash types (perceptual, difference, wavelet, color).
+        list: Card data in the order of card_ids, without cards that could not be fetched.
+        Expired cards that could not be fetched again are returned as stored.
     """
-    # Preprocess the image first
-    img = preprocess_image(img)
-    
-    perceptual = imagehash.phash(img, 32, 8)
-    difference = imagehash.dhash(img, 32)
-    wavelet = imagehash.whash(img, 32)
-    color = imagehash.colorhash(img)
-    return {
-        "perceptual": perceptual,
-        "difference": difference,
-        "wavelet": wavelet,
-        "color": color,
-    }
+    cards = card_store.find_many(card_ids)
+    return [cards[card_id] for card_id in card_ids if card_id in cards]
+
+
+def search_page(query: str, page: int, page_size: int):
+    """
+    Get one page of search results, from the local search index when it can answer the query.
+
+    Args:
+        query (str): Lucene-style search query.
+        page (int): Page number.
+        page_size (int): Cards per page.
+
+    Returns:
+        Page: Cards of the page, with the total number of results.
+    """
+    # Only a completely synced catalog can answer searches, a partial one would miss cards
+    index = search_index.current()
+    if index is not None:
+        try:
+            return index.search(query, page, page_size)
+        except QuerySyntaxError:
+            pass
+    return Card.page(q=query, page=page, page_size=page_size, prefetch=True)
 
 
 def adjust_query(query: str) -> str:
@@ -116,18 +107,26 @@ def adjust_query(query: str) -> str:
     return query
 
 
-card_hashes = pd.read_pickle("card_hashes_32b.pickle")
+RestClient.configure(cache=ResponseCache(disk_path=os.environ.get("POKEMONTCG_CACHE_PATH")))
+card_store = CardStore()
+search_index = SyncedSearchIndex(card_store)
+card_matcher = ReloadingMatcher()
 
 
 app = Flask(__name__)
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
 
 img_height = 825
 img_width = 600
 aspect_ratio = img_height / img_width
 
+# Size of the card crop detection routes hash, when no card outline is found
 rect_height = img_height // 2
 rect_width = img_width // 2
 
+# The camera is streamed at its own resolution, only the card crop of detection routes is enlarged
+DETECTION_SCALE = 1.4
+
 # Initialize video capture
 cap = cv2.VideoCapture(0)
 
@@ -138,35 +137,119 @@ if not cap.isOpened():
     width = 800
     height = 600
 else:
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) * 1.4)
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) * 1.4)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
 
-rect_x = (width - rect_width) // 2
-rect_y = (height - rect_height) // 2
+# Guide rectangle the card is held in, in camera pixels
+guide_width = round(rect_width / DETECTION_SCALE)
+guide_height = round(rect_height / DETECTION_SCALE)
+rect_x = (width - guide_width) // 2
+rect_y = (height - guide_height) // 2
 
 rect_color = (0, 255, 0)
 border = 2
 
 
+def draw_guide(frame, scale=1.0):
+    """
+    Draw the rectangle the card has to be held in on a camera frame.
+
+    Args:
+        frame (np.ndarray): BGR frame, modified in place.
+        scale (float): Size of the frame relative to width x height.
+    """
+    cv2.rectangle(
+        frame,
+        (round(rect_x * scale), round(rect_y * scale)),
+        (round((rect_x + guide_width) * scale), round((rect_y + guide_height) * scale)),
+        rect_color,
+        border,
+    )
+
+
+# The only reader of cap: every stream and detection route takes its frames from here
+camera = CameraFeed(cap, annotate=draw_guide) if cap is not None else None
+
+
+def capture_frame():
+    """
+    Capture the current camera frame.
+
+    Returns:
+        Frame or None: Shared camera frame or None if capture fails.
+    """
+    if camera is None:
+        return None
+    return camera.latest()
+
+
+def localize_card(img: Image) -> tuple:
+    """
+    Cut the largest card out of an image, logging how long it took.
+
+    Args:
+        img (PIL.Image): RGB or grayscale photo or camera frame.
+
+    Returns:
+        tuple: (PIL.Image, corners or None) as returned by localize_image.
+    """
+    start = time.perf_counter()
+    img, corners = localize_image(img)[0]
+    app.logger.debug(
+        "Card localization: %.1f ms, card outline found: %s",
+        (time.perf_counter() - start) * 1000,
+        corners is not None,
+    )
+    return img, corners
+
+
+def card_image(frame) -> Image:
+    """
+    Get the card held in front of the camera.
+
+    Args:
+        frame (Frame): Camera frame.
+
+    Returns:
+        PIL.Image: The card perspective corrected when its outline is found,
+        else the region inside the guide rectangle.
+    """
+    # Camera frames are BGR, PIL images RGB
+    img, corners = localize_card(Image.fromarray(cv2.cvtColor(frame.image, cv2.COLOR_BGR2RGB)))
+    if corners is None:
+        crop = frame.crop(rect_x, rect_y, guide_width, guide_height, (rect_width, rect_height))
+        img = Image.fromarray(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB))
+    return img
+
+
 def capture_image() -> Image or None:
     """
     Capture an image from the camera.
 
     Returns:
-        PIL.Image or None: Captured image as a PIL Image or None if capture fails.
+        PIL.Image or None: Captured card as a PIL Image or None if capture fails.
     """
-    if cap is None:
+    frame = capture_frame()
+    if frame is None:
         return None
-    
-    success, frame = cap.read()
-    if success and frame is not None and frame.size > 0:
-        frame = cv2.resize(frame, (0, 0), fx=1.4, fy=1.4)
-        my_card_frame = frame[
-            rect_y : rect_y + rect_height, rect_x : rect_x + rect_width
-        ]
-        my_card_img = Image.fromarray(my_card_frame)
-        return my_card_img
-    return None
+    return card_image(frame)
+
+
+def recognize_frame(frame) -> list:
+    """
+    Match the card of a camera frame for the live scan.
+
+    Args:
+        frame (Frame): Camera frame as returned by capture_frame.
+
+    Returns:
+        list: (card id, confidence) pairs, best match first.
+    """
+    return card_matcher.most_similar(get_hashes(card_image(frame)), LIVE_SCAN_HASH_TYPE, 3)
+
+
+# Recognizes the card in front of the camera in the background while live scan clients are connected
+live_scanner = LiveRecognizer(capture_frame, recognize_frame)
 
 
 def get_most_similar(img: Image, hash_type="perceptual", n=1):
@@ -175,54 +258,18 @@ def get_most_similar(img: Image, hash_type="perceptual", n=1):
 
     Args:
         img (PIL.Image): Image to compare with the Pokémon card database.
-        hash_type (str): Type of hash to use (perceptual, difference, wavelet, color).
+        hash_type (str): Type of hash to use (perceptual, difference, wavelet, fused).
         n (int): Number of similar cards to retrieve.
 
     Returns:
         str or list: ID(s) of the most similar Pokémon card(s).
     """
-    hashes_dict = get_hashes(img)
-    
-    # Calculate distances for all hash types
-    distances = {}
-    for hash_name in ["perceptual", "difference", "wavelet"]:
-        if hash_name in card_hashes.columns:
-            card_hashes[f"{hash_name}_distance"] = card_hashes[hash_name] - hashes_dict[hash_name]
-            card_hashes[f"{hash_name}_distance"] = card_hashes[f"{hash_name}_distance"].astype("int")
-            distances[hash_name] = card_hashes[f"{hash_name}_distance"]
-    
-    # Use the specified hash type as primary
-    primary_distance = distances.get(hash_type, distances["perceptual"])
-    
-    # Calculate confidence score (lower distance = higher confidence)
-    max_distance = primary_distance.max()
-    confidence_scores = 1 - (primary_distance / max_distance)
-    
-    # Filter for high confidence matches (distance < 50% of max)
-    high_confidence_mask = primary_distance < (max_distance * 0.5)
-    
-    if high_confidence_mask.sum() > 0:
-        # Use only high confidence matches
-        filtered_hashes = card_hashes[high_confidence_mask]
-        filtered_distances = primary_distance[high_confidence_mask]
-        filtered_confidence = confidence_scores[high_confidence_mask]
-    else:
-        # If no high confidence matches, use all
-        filtered_hashes = card_hashes
-        filtered_distances = primary_distance
-        filtered_confidence = confidence_scores
-    
-    # Sort by distance (lowest first)
-    sorted_indices = filtered_distances.argsort()
+    matches = card_matcher.most_similar(get_hashes(img), hash_type, n)
     
     if n > 1:
-        top_indices = sorted_indices[:n]
-        similar_ids = filtered_hashes.iloc[top_indices]["id"].tolist()
-        return similar_ids
+        return [card_id for card_id, _ in matches]
     else:
-        best_index = sorted_indices[0]
-        similar_id = filtered_hashes.iloc[best_index]["id"]
-        confidence = filtered_confidence.iloc[best_index]
+        similar_id, confidence = matches[0]
         
         # Print confidence for debugging
         print(f"Best match confidence: {confidence:.2%}")
@@ -255,9 +302,14 @@ def upload_image():
         return Response("No file selected", status=400)
     
     if file:
-        # Read the image
-        img_data = file.read()
-        img = Image.open(io.BytesIO(img_data))
+        # Decode the image straight from the upload, near the size the hashes need
+        try:
+            img = decode_image(file.stream)
+        except ImageTooLarge as e:
+            return Response(str(e), status=413)
+        
+        # Cut the card out of the photo and straighten it before hashing
+        img, _ = localize_card(img)
         
         # Get the hash type from the request
         hash_type = request.form.get("hash_type", "perceptual")
@@ -266,13 +318,7 @@ def upload_image():
         similar_ids = get_most_similar(img, hash_type, n=5)
         
         # Get card details for all matches
-        similar_cards = []
-        for card_id in similar_ids:
-            try:
-                card = Card.find(card_id)
-                similar_cards.append(card)
-            except:
-                continue
+        similar_cards = find_cards(similar_ids)
         
         if similar_cards:
             # Return the best match as primary result
@@ -320,41 +366,35 @@ def cards():
         search_query = query_string["q"][0]
 
         # get the page size from the query string
-        page_size = query_string["page_size"][0] if "page_size" in query_string else 20
+        page_size = int(query_string["page_size"][0]) if "page_size" in query_string else 20
 
-        response = Card.where(q=search_query, pageSize=page_size, page=page)
-        # Check if there are more pages getting the first card of the next page
-        last_card = page_size * page
-        next_card = Card.where(q=search_query, pageSize=1, page=last_card + 1)
-        last_page = len(next_card) == 0
+        # The page carries the total result count; remote searches also prefetch
+        # the adjacent pages into the response cache for the next HTMX click
+        response = search_page(search_query, page, page_size)
         return render_template(
             "filtered_cards.html",
             cards=response,
-            last_page=last_page,
+            last_page=response.last_page,
             page=page,
         )
 
     search_query = request.args.get("q", None)
-    page_size = request.args.get("page_size", 20)
+    page_size = int(request.args.get("page_size", 20))
     page = 1
 
-    response = Card.where(q=search_query, pageSize=page_size, page=page)
-    # Check if there are more pages getting the first card of the next page
-    last_card = page_size * page
-    next_card = Card.where(q=search_query, pageSize=1, page=last_card + 1)
-    last_page = len(next_card) == 0
+    response = search_page(search_query, page, page_size)
 
     return render_template(
         "filtered_cards.html",
         cards=response,
-        last_page=last_page,
+        last_page=response.last_page,
         page=page,
     )
 
 
 @app.route("/card/<card_id>")
 def card_page(card_id: str):
-    response = Card.find(card_id)
+    response = find_card(card_id)
     return render_template("card_page.html", pokemon=response)
 
 
@@ -366,23 +406,27 @@ def about():
 # Functions for generating and streaming video frames
 
 
-def generate_frames():
-    while True:
-        success, frame = cap.read()
-        if not success:
-            break
-        else:
-            ret, buffer = cv2.imencode(".jpg", frame)
-            if not ret:
-                continue
-            frame = buffer.tobytes()
-            yield (b"--frame\r\n" b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n")
+def generate_frames(fps: float, quality: int, scale: float):
+    """
+    Stream the camera frames with the guide rectangle as MJPEG parts.
+
+    Every client gets the newest frame when it is ready for one, stale
+    frames are dropped, and each variant is encoded only once for all clients.
+    """
+    for jpeg in camera.stream(fps, quality, scale):
+        yield (b"--frame\r\n" b"Content-Type: image/jpeg\r\n\r\n" + jpeg + b"\r\n")
 
 
 @app.route("/video_feed")
 def video_feed():
+    # Clients can trade frame rate, quality and resolution for bandwidth,
+    # e.g. /video_feed?fps=10&quality=60&scale=0.5
+    fps = min(max(request.args.get("fps", DEFAULT_STREAM_FPS, type=float), 1), 30)
+    quality = min(max(request.args.get("quality", DEFAULT_JPEG_QUALITY, type=int), 10), 95)
+    scale = min(max(request.args.get("scale", 1.0, type=float), 0.25), 1.0)
+
     def generate():
-        if cap is None:
+        if camera is None:
             # Return a placeholder image when camera is not available
             import numpy as np
             placeholder = np.zeros((600, 800, 3), dtype=np.uint8)
@@ -394,31 +438,49 @@ def video_feed():
             frame = buffer.tobytes()
             yield (b"--frame\r\n" b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n")
             return
-            
-        while True:
-            success, frame = cap.read()
-            if not success or frame is None or frame.size == 0:
-                break
-                
-            # Remove the horizontal flip - frame = cv2.flip(frame, 1)
-            frame = cv2.resize(frame, (0, 0), fx=1.4, fy=1.4)
-            cv2.rectangle(
-                frame,
-                (rect_x, rect_y),
-                (rect_x + rect_width, rect_y + rect_height),
-                rect_color,
-                border,
-            )
-
-            ret, buffer = cv2.imencode(".jpg", frame)
-            if not ret:
-                continue
-            frame = buffer.tobytes()
-            yield (b"--frame\r\n" b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n")
+
+        yield from generate_frames(fps, quality, scale)
 
     return Response(generate(), mimetype="multipart/x-mixed-replace; boundary=frame")
 
 
+# Live scanning: the detector page listens for stable matches over Server-Sent Events
+
+
+@app.route("/live_scan")
+def live_scan():
+    if camera is None:
+        return Response(status=204)
+
+    def events():
+        # The scan, and with it the camera, pauses once the last client disconnected
+        with live_scanner.listening():
+            seq = 0
+            while True:
+                result = live_scanner.wait(seq, timeout=15)
+                if result["seq"] == seq:
+                    # Comment line that keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                seq = result["seq"]
+                data = {key: result[key] for key in ("seq", "card_id", "confidence")}
+                yield f"data: {json.dumps(data)}\n\n"
+
+    return Response(events(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.route("/live_match")
+def live_match():
+    result = live_scanner.result
+    similar_cards = find_cards([card_id for card_id, _ in result["matches"]])
+    if not similar_cards:
+        return Response(status=204)
+
+    return render_template("pokemon_card_matches.html", 
+                         primary_card=similar_cards[0], 
+                         all_matches=similar_cards)
+
+
 # Routes for comparing images and displaying similar Pokémon cards
 
 
@@ -431,13 +493,7 @@ def perceptual():
     similar_ids = get_most_similar(img, "perceptual", n=3)
     
     # Get card details for matches
-    similar_cards = []
-    for card_id in similar_ids:
-        try:
-            card = Card.find(card_id)
-            similar_cards.append(card)
-        except:
-            continue
+    similar_cards = find_cards(similar_ids)
     
     if similar_cards:
         best_card = similar_cards[0]
@@ -459,13 +515,7 @@ def difference():
     similar_ids = get_most_similar(img, "difference", n=3)
     
     # Get card details for matches
-    similar_cards = []
-    for card_id in similar_ids:
-        try:
-            card = Card.find(card_id)
-            similar_cards.append(card)
-        except:
-            continue
+    similar_cards = find_cards(similar_ids)
     
     if similar_cards:
         best_card = similar_cards[0]
@@ -487,13 +537,7 @@ def wavelet():
     similar_ids = get_most_similar(img, "wavelet", n=3)
     
     # Get card details for matches
-    similar_cards = []
-    for card_id in similar_ids:
-        try:
-            card = Card.find(card_id)
-            similar_cards.append(card)
-        except:
-            continue
+    similar_cards = find_cards(similar_ids)
     
     if similar_cards:
         best_card = similar_cards[0]
@@ -0,0 +1,69 @@
+"""Query time of MultiIndexHash against a brute force scan as the catalog grows
+
+Builds random hash databases of increasing size, queries each with
+near-duplicates of stored hashes (as a rescanned card would be) and checks
+that both searches return the same neighbours within the radius.
+
+    python -m benchmarks.mih_scaling --bits 64 --sizes 17000 100000 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from cardscanner.mih import MultiIndexHash
+
+
+def near_duplicates(base: np.ndarray, count: int, max_flips: int, rng) -> np.ndarray:
+    """Copies of random rows of base with up to max_flips bits flipped"""
+    queries = base[rng.integers(len(base), size=count)].copy()
+    bits = base.shape[1] * 64
+    for query in queries:
+        for bit in rng.choice(bits, size=rng.integers(max_flips + 1), replace=False):
+            query[bit // 64] ^= np.uint64(1) << np.uint64(bit % 64)
+    return queries
+
+
+def timed(search, queries, k, radius):
+    start = time.perf_counter()
+    results = [search(query, k, radius) for query in queries]
+    return (time.perf_counter() - start) / len(queries), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bits", type=int, default=64, help="Hash size in bits, a multiple of 64")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[17000, 100000, 1000000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--max-flips", type=int, default=6, help="Bits flipped in each query")
+    parser.add_argument("--chunk-bits", type=int, default=16)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--radius", type=int, help="Search radius, the index's max_radius by default")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    words = args.bits // 64
+    print(f"{'entries':>10} {'build s':>8} {'mih ms':>8} {'brute ms':>9} {'speedup':>8}  exact")
+    for size in args.sizes:
+        base = rng.integers(0, np.iinfo(np.uint64).max, size=(size, words), dtype=np.uint64, endpoint=True)
+        queries = near_duplicates(base, args.queries, args.max_flips, rng)
+
+        start = time.perf_counter()
+        index = MultiIndexHash(base, args.chunk_bits)
+        build = time.perf_counter() - start
+
+        radius = index.max_radius if args.radius is None else args.radius
+        mih_time, mih_results = timed(index.nearest, queries, args.k, radius)
+        brute_time, brute_results = timed(index.brute_force, queries, args.k, radius)
+        exact = all(
+            np.array_equal(a[0], b[0]) and np.array_equal(a[1], b[1])
+            for a, b in zip(mih_results, brute_results)
+        )
+        print(
+            f"{size:>10} {build:>8.2f} {mih_time * 1e3:>8.3f} {brute_time * 1e3:>9.3f}"
+            f" {brute_time / mih_time:>7.1f}x  {exact}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import imagehash
+import numpy as np
+import pywt
+import scipy.fftpack
+
+from cardscanner.hashindex import HASH_TYPES
+from cardscanner.hashing import HASH_SIZE, ImageHashes
+
+# Images hashed per vectorized pass, small enough for the whash stack to stay in cache
+DEFAULT_CHUNK_SIZE = 16
+
+
+def stack_images(images, hash_types=HASH_TYPES) -> dict:
+    """Resize images for each hash type and stack them into arrays
+
+    Uses the same crop and resize as ``get_hashes``, so the stacked pixels
+    are exactly what imagehash would see for each image. The full
+    resolution grayscale copy of each image is dropped once resized.
+
+    Args:
+        images (list of PIL.Image): Images to stack
+        hash_types (tuple): Hash types to resize for
+    Returns:
+        dict: uint8 array of shape (images, height, width) per hash type
+    """
+    stacks = {hash_type: [] for hash_type in hash_types}
+    for img in images:
+        hashes = ImageHashes(img)
+        for hash_type in hash_types:
+            stacks[hash_type].append(np.asarray(hashes.resized(hash_type)))
+    return {hash_type: np.stack(arrays) for hash_type, arrays in stacks.items()}
+
+
+def _above_median(values: np.ndarray) -> np.ndarray:
+    """Compare every image's values against that image's median"""
+    medians = np.median(values.reshape(len(values), -1), axis=1)
+    return values > medians[:, None, None]
+
+
+def phash_batch(pixels: np.ndarray, hash_size: int = HASH_SIZE) -> np.ndarray:
+    """Perceptual hash of a stack of images, as imagehash.phash computes it
+
+    Args:
+        pixels (np.ndarray): Grayscale stack of shape (images, size, size)
+        hash_size (int): Hash size
+    Returns:
+        np.ndarray: bool array of shape (images, hash_size, hash_size)
+    """
+    dct = scipy.fftpack.dct(scipy.fftpack.dct(pixels, axis=1), axis=2)
+    return _above_median(dct[:, :hash_size, :hash_size])
+
+
+def dhash_batch(pixels: np.ndarray) -> np.ndarray:
+    """Difference hash of a stack of images, as imagehash.dhash computes it
+
+    Args:
+        pixels (np.ndarray): Grayscale stack of shape (images, size, size + 1)
+    Returns:
+        np.ndarray: bool array of shape (images, size, size)
+    """
+    return pixels[:, :, 1:] > pixels[:, :, :-1]
+
+
+def whash_batch(pixels: np.ndarray, hash_size: int = HASH_SIZE) -> np.ndarray:
+    """Haar wavelet hash of a stack of images, as imagehash.whash computes it
+
+    Args:
+        pixels (np.ndarray): Grayscale stack of shape (images, scale, scale)
+            where scale is a power of 2
+        hash_size (int): Hash size, a power of 2
+    Returns:
+        np.ndarray: bool array of shape (images, hash_size, hash_size)
+    """
+    ll_max_level = int(np.log2(pixels.shape[-1]))
+    dwt_level = ll_max_level - int(np.log2(hash_size))
+    pixels = pixels / 255.0
+
+    # Remove the lowest frequency LL(max_ll), as imagehash does by default
+    coeffs = list(pywt.wavedec2(pixels, "haar", level=ll_max_level, axes=(-2, -1)))
+    coeffs[0] *= 0
+    pixels = pywt.waverec2(coeffs, "haar", axes=(-2, -1))
+
+    coeffs = pywt.wavedec2(pixels, "haar", level=dwt_level, axes=(-2, -1))
+    return _above_median(coeffs[0])
+
+
+BATCH_HASHERS = {
+    "perceptual": phash_batch,
+    "difference": dhash_batch,
+    "wavelet": whash_batch,
+}
+
+
+def pack_bits(bits: np.ndarray) -> np.ndarray:
+    """Pack a stack of hash bit arrays into a HashIndex matrix
+
+    Args:
+        bits (np.ndarray): bool array of shape (images, ...)
+    Returns:
+        np.ndarray: uint64 array of shape (images, words), laid out like pack_hash
+    """
+    packed = np.packbits(bits.reshape(len(bits), -1), axis=1)
+    padding = -packed.shape[1] % 8
+    if padding:
+        packed = np.pad(packed, ((0, 0), (0, padding)))
+    return np.ascontiguousarray(packed).view(">u8").astype(np.uint64)
+
+
+def hash_chunk(images, hash_types=HASH_TYPES) -> dict:
+    """Hash one chunk of images in a single vectorized pass per hash type
+
+    Args:
+        images (list of PIL.Image): Images to hash
+        hash_types (tuple): Hash types to compute
+    Returns:
+        dict: Packed uint64 matrix of shape (images, words) per hash type
+    """
+    stacks = stack_images(images, hash_types)
+    return {
+        hash_type: pack_bits(BATCH_HASHERS[hash_type](pixels))
+        for hash_type, pixels in stacks.items()
+    }
+
+
+def hash_batch(images, hash_types=HASH_TYPES, chunk_size: int = DEFAULT_CHUNK_SIZE,
+               max_workers: int = None) -> dict:
+    """Hash many images at once in vectorized passes
+
+    The images are split into chunks that are resized, stacked and hashed
+    together. PIL, scipy and pywt release the GIL in their inner loops, so
+    chunks are hashed concurrently on a thread pool. The output is
+    bit-identical to ``get_hashes`` for every image, so it can be appended
+    to an existing hash database.
+
+    Args:
+        images (list of PIL.Image): Images to hash
+        hash_types (tuple): Hash types to compute
+        chunk_size (int): Images hashed per vectorized pass
+        max_workers (int): Hashing threads, None for the executor default
+    Returns:
+        dict: Packed uint64 matrix of shape (images, words) per hash type
+    """
+    images = list(images)
+    chunks = [images[start : start + chunk_size] for start in range(0, len(images), chunk_size)]
+    with ThreadPoolExecutor(max_workers) as executor:
+        results = list(executor.map(lambda chunk: hash_chunk(chunk, hash_types), chunks))
+    return {
+        hash_type: (
+            np.concatenate([result[hash_type] for result in results])
+            if results else np.empty((0, 0), np.uint64)
+        )
+        for hash_type in hash_types
+    }
+
+
+def to_image_hashes(matrix: np.ndarray, hash_size: int = HASH_SIZE) -> list:
+    """Unpack a packed hash matrix into imagehash.ImageHash objects
+
+    Args:
+        matrix (np.ndarray): uint64 array of shape (images, words)
+        hash_size (int): Side of the square hash
+    Returns:
+        list of ImageHash: One hash per row
+    """
+    bits = np.unpackbits(matrix.astype(">u8").view(np.uint8), axis=1)
+    bits = bits[:, : hash_size * hash_size].astype(bool)
+    return [imagehash.ImageHash(row.reshape(hash_size, hash_size)) for row in bits]
@@ -0,0 +1,196 @@
+import argparse
+import io
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+import requests
+from PIL import Image
+
+from cardscanner import hashdb
+from cardscanner.batchhash import hash_batch
+from cardscanner.hashindex import HASH_TYPES
+from pokemontcgmanager.card import Card
+from pokemontcgmanager.restclient import RestClient
+from pokemontcgmanager.set import Set
+
+# Card images downloaded at the same time
+DEFAULT_DOWNLOADS = 16
+
+# Cards downloaded and hashed together, bounds the decoded images held in memory
+BATCH_SIZE = 128
+
+# Which of the API's card images is hashed
+IMAGE_SIZE = "large"
+
+
+def download_image(url: str) -> Image or None:
+    """Download and decode an image over the RestClient session without the API key
+
+    Args:
+        url (string): Image URL
+    Returns:
+        PIL.Image: Decoded image, or None if it couldn't be downloaded
+    """
+    try:
+        response = RestClient.download_session().get(url, timeout=RestClient.timeout)
+        response.raise_for_status()
+        img = Image.open(io.BytesIO(response.content))
+        img.load()
+        return img
+    except (requests.RequestException, OSError):
+        return None
+
+
+class HashDBBuilder:
+    """Keeps the card hash database up to date with the Pokemon TCG API
+
+    Cards that are not in the database yet are found set by set, their
+    images are downloaded concurrently and hashed exactly like a scan
+    would be, and the new hashes are appended as a delta segment next to
+    the database. ``compact`` later folds the segments into the base file.
+    """
+
+    def __init__(self, path: str = hashdb.DEFAULT_PATH, downloads: int = DEFAULT_DOWNLOADS, log=print):
+        self.path = path
+        self.downloads = downloads
+        self.log = log
+
+    def known_ids(self) -> set:
+        """Ids of every card in the database and its segments"""
+        return {card_id for db in hashdb.open_all(self.path) for card_id in db.ids}
+
+    def missing_cards(self, set_ids=None) -> list:
+        """Find the cards that have no hashes yet
+
+        Without set ids, sets that already have as many hashed cards as
+        the set's total are skipped without listing their cards.
+
+        Args:
+            set_ids (list of string): Only look at these sets
+        Returns:
+            list of dict: Card data of the missing cards
+        """
+        known = self.known_ids()
+        known_per_set = Counter(card_id.rsplit("-", 1)[0] for card_id in known)
+
+        missing = []
+        for card_set in Set.all():
+            if set_ids and card_set["id"] not in set_ids:
+                continue
+            if not set_ids and known_per_set[card_set["id"]] >= card_set.get("total", 0):
+                continue
+            cards = Card.where(q=f"set.id:{card_set['id']}")
+            new = [card for card in cards if card["id"] not in known and card.get("images")]
+            if new:
+                self.log(f"{card_set['id']}: {len(new)} new cards")
+            missing.extend(new)
+        return missing
+
+    def hash_cards(self, cards) -> tuple:
+        """Download and hash card images
+
+        Args:
+            cards (list of dict): Card data with image URLs
+        Returns:
+            tuple: (ids, packed matrices keyed by hash type) of the cards
+            whose image could be downloaded
+        """
+        ids = []
+        parts = {hash_type: [] for hash_type in HASH_TYPES}
+        with ThreadPoolExecutor(self.downloads) as executor:
+            for start in range(0, len(cards), BATCH_SIZE):
+                batch = cards[start : start + BATCH_SIZE]
+                urls = [card["images"].get(IMAGE_SIZE) for card in batch]
+                images = list(executor.map(download_image, urls))
+                downloaded = [(card, img) for card, img in zip(batch, images) if img is not None]
+                for card, img in zip(batch, images):
+                    if img is None:
+                        self.log(f"Could not download the image of {card['id']}")
+                if not downloaded:
+                    continue
+
+                hashes = hash_batch([img for _, img in downloaded], HASH_TYPES)
+                ids.extend(card["id"] for card, _ in downloaded)
+                for hash_type, matrix in hashes.items():
+                    parts[hash_type].append(matrix)
+                self.log(f"Hashed {len(ids)} of {len(cards)} cards")
+
+        matrices = {hash_type: np.concatenate(matrix) for hash_type, matrix in parts.items() if matrix}
+        return ids, matrices
+
+    def update(self, set_ids=None) -> str or None:
+        """Hash every missing card into a new delta segment
+
+        The first update of a database that only exists as the pickle
+        converts the pickle into the base file, so its cards are kept.
+
+        Args:
+            set_ids (list of string): Only look at these sets
+        Returns:
+            string: Path of the new segment, or None if nothing was missing
+        """
+        if not hashdb.open_all(self.path) and os.path.exists(hashdb.DEFAULT_PICKLE_PATH):
+            self.log(f"Converting {hashdb.DEFAULT_PICKLE_PATH} into {self.path}")
+            hashdb.convert(hashdb.DEFAULT_PICKLE_PATH, self.path)
+
+        cards = self.missing_cards(set_ids)
+        if not cards:
+            self.log("No missing cards")
+            return None
+
+        ids, matrices = self.hash_cards(cards)
+        if not ids:
+            return None
+
+        added_sets = sorted({card["set"]["id"] for card in cards if card.get("set")})
+        timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        label = added_sets[0] if len(added_sets) == 1 else f"{len(added_sets)}-sets"
+        path = os.path.join(hashdb.segment_dir(self.path), f"{timestamp}-{label}.cardhash")
+        os.makedirs(hashdb.segment_dir(self.path), exist_ok=True)
+        hashdb.write(path, ids, matrices, {"source": "builder", "sets": added_sets})
+        self.log(f"Wrote {len(ids)} cards to {path}")
+        return path
+
+    def compact(self) -> int:
+        """Fold every delta segment into the base database file
+
+        Returns:
+            int: Number of cards in the compacted database
+        """
+        segments = hashdb.segment_paths(self.path)
+        if not segments:
+            return len(hashdb.HashDB(self.path)) if os.path.exists(self.path) else 0
+
+        ids, matrices = hashdb.merge(hashdb.open_all(self.path))
+        hashdb.write(self.path, ids, matrices, {"source": "compaction"})
+        # The new base already holds the segments, so loaders that still see
+        # them in between only get duplicate rows, which merging drops
+        for segment in segments:
+            os.remove(segment)
+        self.log(f"Compacted {len(segments)} segments into {self.path}: {len(ids)} cards")
+        return len(ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental card hash database builder")
+    parser.add_argument("command", choices=["update", "compact", "status"])
+    parser.add_argument("--db", default=hashdb.DEFAULT_PATH, help="Hash database file")
+    parser.add_argument("--set", dest="set_ids", action="append", help="Only update this set id")
+    parser.add_argument("--downloads", type=int, default=DEFAULT_DOWNLOADS, help="Concurrent image downloads")
+    args = parser.parse_args()
+
+    builder = HashDBBuilder(args.db, args.downloads)
+    if args.command == "update":
+        builder.update(args.set_ids)
+    elif args.command == "compact":
+        builder.compact()
+    else:
+        for db in hashdb.open_all(args.db):
+            print(f"{db.path}: {len(db)} cards, version {db.version}")
+
+
+if __name__ == "__main__":
+    main()
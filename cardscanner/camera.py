@@ -0,0 +1,260 @@
+import os
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+# Most recent camera frames kept in memory
+DEFAULT_BUFFER_FRAMES = int(os.environ.get("CAMERA_BUFFER_FRAMES", 4))
+
+# Seconds to wait before reading again after the camera failed to deliver a frame
+READ_RETRY_DELAY = 0.1
+
+# JPEG quality of streamed frames when a client doesn't ask for one
+DEFAULT_JPEG_QUALITY = int(os.environ.get("MJPEG_QUALITY", 75))
+
+# Frames per second streamed when a client doesn't ask for a rate
+DEFAULT_STREAM_FPS = float(os.environ.get("MJPEG_FPS", 15))
+
+# Seconds without any consumer asking for a frame before the camera is no longer read
+DEFAULT_IDLE_TIMEOUT = float(os.environ.get("CAMERA_IDLE_TIMEOUT", 10))
+
+
+class Frame:
+    """One camera frame, shared by every consumer
+
+    ``image`` is the BGR frame as the camera delivered it and must not be
+    modified. Consumers see it at ``scale`` times that size, which is
+    only ever applied to what they actually use: the crop of a detection
+    route, or the streamed JPEG. Each JPEG variant is encoded by the first
+    client that asks for it and reused by all the others.
+    """
+
+    def __init__(self, seq: int, image, scale: float, render):
+        self.seq = seq
+        self.image = image
+        self.scale = scale
+        self.timestamp = time.monotonic()
+        self._render = render
+        self._lock = threading.Lock()
+        self._jpegs = {}
+
+    def __array__(self, dtype=None):
+        return self.image if dtype is None else self.image.astype(dtype)
+
+    @property
+    def size(self) -> tuple:
+        """(width, height) of the frame as consumers see it"""
+        height, width = self.image.shape[:2]
+        return (int(width * self.scale), int(height * self.scale))
+
+    def crop(self, x: int, y: int, width: int, height: int, size: tuple = None):
+        """Copy of a region of the frame, safe to modify
+
+        Args:
+            x, y, width, height (int): Region in the coordinates of ``size``
+            size (tuple): (width, height) to resize the region to, its own
+                width and height by default
+        Returns:
+            np.ndarray: BGR region of ``size``
+        """
+        size = size or (width, height)
+        left, top = int(x / self.scale), int(y / self.scale)
+        right, bottom = int((x + width) / self.scale), int((y + height) / self.scale)
+        region = self.image[top:bottom, left:right]
+        if region.shape[1::-1] == tuple(size):
+            return region.copy()
+        return cv2.resize(region, tuple(size), interpolation=cv2.INTER_LINEAR)
+
+    def jpeg(self, quality: int = DEFAULT_JPEG_QUALITY, scale: float = 1.0) -> bytes:
+        """JPEG of the annotated frame, encoded once per quality and scale
+
+        Args:
+            quality (int): JPEG quality, 1 to 100
+            scale (float): Size relative to ``size``
+        Returns:
+            bytes: Encoded frame, empty if encoding failed
+        """
+        key = (quality, scale)
+        with self._lock:
+            if key not in self._jpegs:
+                self._jpegs[key] = self._render(self.image, quality, self.scale * scale)
+            return self._jpegs[key]
+
+
+class CameraFeed:
+    """Single reader thread owning a cv2.VideoCapture
+
+    cv2 capture handles aren't safe to read from several threads, and
+    every extra reader takes frames away from the others. Instead one
+    thread reads the camera and publishes every frame into a ring buffer
+    of the last ``buffer_size`` frames. MJPEG streams and detection routes
+    all read from the buffer, so the camera work is the same however many
+    clients are connected.
+
+    Frames are presented at ``scale`` times the camera resolution, but
+    the reader thread doesn't resize them: streams resize straight to the
+    size they send into a buffer preallocated per output size, and
+    ``annotate(image, scale)`` then draws overlays such as the guide
+    rectangle in place before the buffer is encoded, ``scale`` being the
+    size of the buffer relative to the presented frame.
+
+    The thread starts with the first consumer. Once no consumer has asked
+    for a frame in ``idle_timeout`` seconds it stops reading the camera,
+    and the next consumer starts it again.
+    """
+
+    def __init__(
+        self,
+        capture,
+        scale: float = 1.0,
+        annotate=None,
+        buffer_size: int = DEFAULT_BUFFER_FRAMES,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+        log=print,
+    ):
+        self.capture = capture
+        self.scale = scale
+        self.annotate = annotate
+        self.idle_timeout = idle_timeout
+        self.log = log
+        self._frames = deque(maxlen=buffer_size)
+        self._seq = 0
+        self._new_frame = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_used = time.monotonic()
+        # Output buffer and its lock per streamed frame shape
+        self._buffers = {}
+        self._buffers_lock = threading.Lock()
+
+    def start(self):
+        """Start the reader thread if it isn't running yet, and keep it from idling"""
+        with self._new_frame:
+            self._last_used = time.monotonic()
+            if self._thread is None and not self._stop.is_set():
+                self._thread = threading.Thread(target=self._run, name="camera-reader", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Stop the reader thread and release the camera"""
+        self._stop.set()
+        with self._new_frame:
+            # An idle reader is gone already, so the camera is released here
+            if self._thread is None:
+                self.capture.release()
+
+    def wait(self, seq: int = 0, timeout: float = 5) -> Frame or None:
+        """Wait for a frame newer than the one a consumer already has
+
+        Frames a consumer was too slow to pick up are skipped: it always
+        gets the newest one.
+
+        Args:
+            seq (int): ``seq`` of the last frame seen, 0 for none
+            timeout (float): Seconds to wait at most
+        Returns:
+            Frame or None: Newest frame, or None if none arrived in time
+        """
+        self.start()
+        with self._new_frame:
+            if not self._new_frame.wait_for(lambda: self._seq > seq, timeout):
+                return None
+            return self._frames[-1]
+
+    def latest(self, timeout: float = 5) -> Frame or None:
+        """Newest frame, waiting for the first one if there is none yet"""
+        return self.wait(0, timeout)
+
+    def recent(self) -> list:
+        """Frames in the ring buffer, oldest first"""
+        with self._new_frame:
+            return list(self._frames)
+
+    def stream(self, fps: float = DEFAULT_STREAM_FPS, quality: int = DEFAULT_JPEG_QUALITY, scale: float = 1.0):
+        """Generate the JPEGs of one streaming client
+
+        The client gets at most ``fps`` frames per second, and always the
+        newest frame when it is ready for the next one: frames that came in
+        while it was still sending the previous one are dropped rather than
+        queued, so a slow client falls behind in frame rate, not in time.
+
+        Args:
+            fps (float): Most frames per second to send
+            quality (int): JPEG quality, 1 to 100
+            scale (float): Size relative to the presented frame
+        Yields:
+            bytes: Encoded frames, until the camera stops delivering
+        """
+        period = 1 / fps
+        seq = 0
+        next_time = time.monotonic()
+        while True:
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            frame = self.wait(seq)
+            if frame is None:
+                return
+            seq = frame.seq
+            # Schedule from now when behind, instead of bursting to catch up
+            next_time = max(next_time + period, time.monotonic())
+            jpeg = frame.jpeg(quality, scale)
+            if jpeg:
+                yield jpeg
+
+    def render(self, image, quality: int, scale: float) -> bytes:
+        """Resize, annotate and encode a camera image for streaming
+
+        Args:
+            image (np.ndarray): BGR image as the camera delivered it
+            quality (int): JPEG quality, 1 to 100
+            scale (float): Size relative to the camera resolution
+        Returns:
+            bytes: Encoded frame, empty if encoding failed
+        """
+        height, width = image.shape[:2]
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        shape = (size[1], size[0]) + image.shape[2:]
+        with self._buffers_lock:
+            if shape not in self._buffers:
+                self._buffers[shape] = (np.empty(shape, dtype=image.dtype), threading.Lock())
+            buffer, lock = self._buffers[shape]
+
+        with lock:
+            if size == (width, height):
+                np.copyto(buffer, image)
+            else:
+                interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+                cv2.resize(image, size, dst=buffer, interpolation=interpolation)
+            if self.annotate is not None:
+                self.annotate(buffer, scale / self.scale)
+            success, encoded = cv2.imencode(".jpg", buffer, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        return encoded.tobytes() if success else b""
+
+    def _run(self):
+        failures = 0
+        try:
+            while not self._stop.is_set():
+                with self._new_frame:
+                    if time.monotonic() - self._last_used > self.idle_timeout:
+                        # Hand over to the next consumer's start() under the same lock
+                        self._thread = None
+                        return
+                success, image = self.capture.read()
+                if not success or image is None or image.size == 0:
+                    failures += 1
+                    if failures == 1:
+                        self.log("Warning: Could not read a frame from the camera.")
+                    time.sleep(READ_RETRY_DELAY)
+                    continue
+                failures = 0
+                with self._new_frame:
+                    self._seq += 1
+                    self._frames.append(Frame(self._seq, image, self.scale, self.render))
+                    self._new_frame.notify_all()
+        finally:
+            if self._stop.is_set():
+                self.capture.release()
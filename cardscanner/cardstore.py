@@ -0,0 +1,277 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+from pokemontcgmanager.card import Card
+from pokemontcgmanager.set import Set
+
+DEFAULT_PATH = os.environ.get("CARD_STORE_PATH", "card_store.sqlite3")
+
+# Seconds a stored card stays fresh before it is fetched again, mostly for its prices.
+# Same as the API response cache keeps cards.
+DEFAULT_MAX_AGE = float(os.environ.get("CARD_STORE_MAX_AGE", 6 * 60 * 60))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cards (
+    id TEXT PRIMARY KEY,
+    set_id TEXT,
+    data TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cards_set_id ON cards (set_id);
+CREATE TABLE IF NOT EXISTS sets (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class CardStore:
+    """Local SQLite store of card metadata keyed by card id
+
+    Filled by ``sync`` from the Pokemon TCG API, and read instead of the
+    API when scanning. Every thread gets its own connection, and the
+    database runs in WAL mode so readers never wait on a sync.
+
+    Cards carry prices that change daily, so ``get`` and ``get_many`` only
+    return cards written in the last ``max_age`` seconds and callers fetch
+    the others again.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM cards").fetchone()[0]
+
+    @staticmethod
+    def _cutoff(max_age: float or None) -> str:
+        # updated_at is an ISO 8601 UTC timestamp, so timestamps compare as strings
+        if max_age is None:
+            return ""
+        return (datetime.now(timezone.utc) - timedelta(seconds=max_age)).isoformat()
+
+    def get(self, card_id: str, max_age: float = DEFAULT_MAX_AGE) -> dict or None:
+        """Get a card by its id
+
+        Args:
+            card_id (string): Card id
+            max_age (float): Seconds since the card was stored, None for any age
+        Returns:
+            dict: Card data as returned by the API, or None if not stored or expired
+        """
+        row = self._connection().execute(
+            "SELECT data FROM cards WHERE id = ? AND updated_at >= ?",
+            (card_id, self._cutoff(max_age)),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_many(self, card_ids, max_age: float = DEFAULT_MAX_AGE) -> dict:
+        """Get several cards by id in one query
+
+        Args:
+            card_ids (list of string): Card ids
+            max_age (float): Seconds since the cards were stored, None for any age
+        Returns:
+            dict: Card data keyed by id, for the ids that are stored and not expired
+        """
+        card_ids = list(dict.fromkeys(card_ids))
+        if not card_ids:
+            return {}
+        placeholders = ",".join("?" * len(card_ids))
+        rows = self._connection().execute(
+            f"SELECT id, data FROM cards WHERE id IN ({placeholders}) AND updated_at >= ?",
+            card_ids + [self._cutoff(max_age)],
+        )
+        return {card_id: json.loads(data) for card_id, data in rows}
+
+    def find(self, card_id: str) -> dict:
+        """Get a card, fetching it from the Pokemon TCG API when missing or expired
+
+        An expired card is returned as stored when the API can't be reached.
+
+        Args:
+            card_id (string): Card id
+        Returns:
+            dict: Card data as returned by the API
+        Raises:
+            requests.RequestException: If the card isn't stored and can't be fetched
+        """
+        card = self.get(card_id)
+        if card is not None:
+            return card
+        try:
+            card = Card.find(card_id)
+        except requests.RequestException:
+            card = self.get(card_id, max_age=None)
+            if card is None:
+                raise
+            return card
+        self.put(card)
+        return card
+
+    def find_many(self, card_ids) -> dict:
+        """Get several cards, fetching the missing or expired ones from the API concurrently
+
+        Expired cards that can't be fetched are returned as stored.
+
+        Args:
+            card_ids (list of string): Card ids
+        Returns:
+            dict: Card data keyed by id, without cards that could not be found at all
+        """
+        cards = self.get_many(card_ids)
+        missing = [card_id for card_id in dict.fromkeys(card_ids) if card_id not in cards]
+        fetched = [card for card in Card.find_many(missing) if card is not None]
+        if fetched:
+            self.put_many(fetched)
+            cards.update((card["id"], card) for card in fetched)
+        if len(fetched) < len(missing):
+            cards.update(self.get_many([card_id for card_id in missing if card_id not in cards], max_age=None))
+        return cards
+
+    def iter_cards(self):
+        """Iterate over every stored card
+
+        Returns:
+            generator of dict: Card data as returned by the API
+        """
+        rows = self._connection().execute("SELECT data FROM cards")
+        for (data,) in rows:
+            yield json.loads(data)
+
+    def put_many(self, cards) -> int:
+        """Insert or replace cards
+
+        Args:
+            cards (list of dict): Card data as returned by the API
+        Returns:
+            int: Number of cards written
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        rows = [
+            (card["id"], card.get("set", {}).get("id"), json.dumps(card), now)
+            for card in cards
+        ]
+        with self._connection() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO cards (id, set_id, data, updated_at) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+        return len(rows)
+
+    def put(self, card: dict):
+        """Insert or replace a single card"""
+        self.put_many([card])
+
+    def put_sets(self, sets) -> int:
+        """Insert or replace sets
+
+        Args:
+            sets (list of dict): Set data as returned by the API
+        Returns:
+            int: Number of sets written
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        rows = [(s["id"], json.dumps(s), now) for s in sets]
+        with self._connection() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO sets (id, data, updated_at) VALUES (?, ?, ?)", rows
+            )
+        return len(rows)
+
+    def sets(self) -> list:
+        """Get every stored set"""
+        rows = self._connection().execute("SELECT data FROM sets")
+        return [json.loads(data) for (data,) in rows]
+
+    def catalog_version(self) -> str or None:
+        """Version of the card catalog, set by every sync after a full one
+
+        Cards are also written one by one as they are looked up, so the
+        number of stored cards says nothing about whether the store holds
+        the whole catalog. Only a completed full sync does.
+
+        Returns:
+            string: Time the last sync completed, None if no full sync ever has
+        """
+        row = self._connection().execute(
+            "SELECT value FROM meta WHERE key = 'catalog_version'"
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set_catalog_version(self):
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('catalog_version', ?)",
+                (datetime.now(timezone.utc).isoformat(),),
+            )
+
+    def sync(self, set_ids=None, log=print) -> int:
+        """Fill the store from the Pokemon TCG API
+
+        A full sync pulls the whole card catalog, page by page, with pages
+        fetched concurrently. With set ids only those sets are pulled.
+
+        Args:
+            set_ids (list of string): Only sync these sets, all sets if None
+            log (callable): Progress logger
+        Returns:
+            int: Number of cards written
+        """
+        self.put_sets(Set.all())
+
+        queries = [f"set.id:{set_id}" for set_id in set_ids] if set_ids else [None]
+        total = 0
+        for q in queries:
+            params = {"pageSize": 250}
+            if q is not None:
+                params["q"] = q
+            for page in Card.where_pages(**params):
+                total += self.put_many(page)
+                log(f"{q or 'all cards'}: {total} cards")
+        # A set sync keeps a complete catalog complete, but doesn't make a partial one complete
+        if not set_ids or self.catalog_version() is not None:
+            self._set_catalog_version()
+        log(f"Synced {total} cards into {self.path}")
+        return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local card metadata store")
+    parser.add_argument("command", choices=["sync", "count"])
+    parser.add_argument("--path", default=DEFAULT_PATH, help="SQLite database file")
+    parser.add_argument("--set", dest="set_ids", action="append", help="Only sync this set id")
+    args = parser.parse_args()
+
+    store = CardStore(args.path)
+    if args.command == "sync":
+        store.sync(args.set_ids)
+    else:
+        print(len(store))
+
+
+if __name__ == "__main__":
+    main()
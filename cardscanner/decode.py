@@ -0,0 +1,60 @@
+import math
+import os
+
+from PIL import Image
+
+from cardscanner.hashing import CARD_HEIGHT, CARD_WIDTH, card_box
+
+# Largest upload accepted, in bytes
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 20 * 1024 * 1024))
+
+# Largest image accepted, in pixels, checked before the image is decoded
+MAX_IMAGE_PIXELS = int(os.environ.get("MAX_IMAGE_PIXELS", 50_000_000))
+
+
+class ImageTooLarge(ValueError):
+    """Raised for images with more pixels than the decoder accepts"""
+
+
+def draft_size(size: tuple) -> tuple:
+    """Smallest image size whose card region still covers a full size card
+
+    Args:
+        size (tuple): (width, height) of the image
+    Returns:
+        tuple: (width, height) to decode the image at, at most its own size
+    """
+    left, top, right, bottom = card_box(size)
+    scale = max(CARD_WIDTH / (right - left), CARD_HEIGHT / (bottom - top))
+    if scale >= 1:
+        return size
+    return (math.ceil(size[0] * scale), math.ceil(size[1] * scale))
+
+
+def decode_image(stream, mode: str = "RGB", max_pixels: int = MAX_IMAGE_PIXELS) -> Image:
+    """
+    Decode an uploaded image no larger than the hashes need.
+
+    JPEGs are decoded straight at 1/2, 1/4 or 1/8 scale in the DCT domain
+    (PIL draft mode) as long as the card region stays at least 600x825,
+    which skips most of the decoding and resizing work on phone photos.
+    In 'L' mode only the luma channel of a JPEG is decoded.
+
+    Args:
+        stream (file-like): Upload stream or any readable binary file
+        mode (str): 'RGB', or 'L' when only grayscale hashes are needed
+        max_pixels (int): Largest image accepted, in pixels
+
+    Returns:
+        PIL.Image: Decoded image, in the requested mode for JPEGs
+
+    Raises:
+        ImageTooLarge: If the image has more than max_pixels pixels
+    """
+    img = Image.open(stream)
+    width, height = img.size
+    if width * height > max_pixels:
+        raise ImageTooLarge(f"Image is {width}x{height}, at most {max_pixels} pixels are accepted")
+    img.draft(mode, draft_size(img.size))
+    img.load()
+    return img
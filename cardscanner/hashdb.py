@@ -0,0 +1,325 @@
+import argparse
+import glob
+import json
+import os
+import struct
+from datetime import datetime, timezone
+
+import numpy as np
+
+from cardscanner.hashindex import HASH_TYPES, HashIndex
+
+MAGIC = b"CARDHASH"
+FORMAT_VERSION = 1
+
+# Every section starts on a 64-byte boundary so the memory-mapped arrays
+# are aligned for vectorized loads
+ALIGNMENT = 64
+
+# magic, format version, metadata length
+HEADER = struct.Struct("<8sII")
+
+DEFAULT_PATH = os.environ.get("CARD_HASH_DB", "card_hashes.cardhash")
+DEFAULT_PICKLE_PATH = "card_hashes_32b.pickle"
+
+
+class HashDBError(ValueError):
+    """Raised when a file is not a hash database this version can read"""
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write(path: str, ids, matrices: dict, metadata: dict = None):
+    """Write a hash database file
+
+    Layout: a fixed header (magic, format version, metadata length), the
+    JSON metadata, then 64-byte aligned sections for every little-endian
+    uint64 hash matrix, the id offsets and the utf-8 id blob. The
+    metadata records the offset and shape of each section.
+
+    Args:
+        path (string): File to write, replaced atomically
+        ids (list of string): Card ids, one per matrix row
+        matrices (dict): (cards, words) uint64 matrices keyed by hash type
+        metadata (dict): Extra metadata to store, e.g. the source
+    """
+    ids = list(ids)
+    encoded = [card_id.encode("utf-8") for card_id in ids]
+    id_offsets = np.zeros(len(ids) + 1, dtype="<u8")
+    id_offsets[1:] = np.cumsum([len(card_id) for card_id in encoded], dtype=np.uint64)
+    blob = b"".join(encoded)
+
+    sections = []
+    for hash_type, matrix in matrices.items():
+        matrix = np.ascontiguousarray(matrix, dtype="<u8")
+        if matrix.shape[0] != len(ids):
+            raise ValueError(f"{hash_type} has {matrix.shape[0]} rows for {len(ids)} ids")
+        sections.append((hash_type, matrix))
+
+    meta = dict(metadata or {})
+    meta.update(
+        version=meta.get("version") or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ"),
+        count=len(ids),
+        bits={name: matrix.shape[1] * 64 for name, matrix in sections},
+        hash_types={},
+    )
+
+    # Offsets depend on the metadata length, so lay the file out until it settles
+    offsets = {}
+    while True:
+        meta["hash_types"] = {
+            name: {"offset": offsets.get(name, 0), "words": matrix.shape[1]}
+            for name, matrix in sections
+        }
+        meta["ids"] = {
+            "offsets": offsets.get("ids", 0),
+            "blob": offsets.get("blob", 0),
+            "size": len(blob),
+        }
+        encoded_meta = json.dumps(meta, sort_keys=True).encode("utf-8")
+        position = _aligned(HEADER.size + len(encoded_meta))
+        layout = {}
+        for name, matrix in sections:
+            layout[name] = position
+            position = _aligned(position + matrix.nbytes)
+        layout["ids"] = position
+        layout["blob"] = _aligned(position + id_offsets.nbytes)
+        if layout == offsets:
+            break
+        offsets = layout
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(encoded_meta)))
+        f.write(encoded_meta)
+        for name, array in [*sections, ("ids", id_offsets)]:
+            f.seek(offsets[name])
+            f.write(array.tobytes())
+        f.seek(offsets["blob"])
+        f.write(blob)
+    os.replace(temp_path, path)
+
+
+class HashDB:
+    """Read-only, memory-mapped view of a hash database file
+
+    The hash matrices are np.memmap views straight into the file, so every
+    process that opens the same file shares its pages through the OS page
+    cache and opening it costs next to nothing.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                raise HashDBError(f"{path} is too short to be a hash database")
+            magic, version, meta_length = HEADER.unpack(header)
+            if magic != MAGIC:
+                raise HashDBError(f"{path} is not a hash database")
+            if version > FORMAT_VERSION:
+                raise HashDBError(f"{path} uses format version {version}, newer than {FORMAT_VERSION}")
+            self.metadata = json.loads(f.read(meta_length))
+        self.format_version = version
+
+        count = self.metadata["count"]
+        self.matrices = {
+            name: np.memmap(path, dtype="<u8", mode="r", offset=section["offset"], shape=(count, section["words"]))
+            for name, section in self.metadata["hash_types"].items()
+        }
+        ids = self.metadata["ids"]
+        self.id_offsets = np.memmap(path, dtype="<u8", mode="r", offset=ids["offsets"], shape=(count + 1,))
+        self.id_blob = np.memmap(path, dtype=np.uint8, mode="r", offset=ids["blob"], shape=(ids["size"],))
+
+    def __len__(self) -> int:
+        return self.metadata["count"]
+
+    @property
+    def version(self) -> str:
+        """Version of the data, set when the file was written"""
+        return self.metadata["version"]
+
+    @property
+    def ids(self) -> list:
+        """Card ids, in row order"""
+        blob = self.id_blob.tobytes()
+        bounds = self.id_offsets.tolist()
+        return [blob[start:end].decode("utf-8") for start, end in zip(bounds, bounds[1:])]
+
+    def to_index(self) -> HashIndex:
+        """Build a HashIndex over the memory-mapped matrices without copying them"""
+        return HashIndex(self.ids, self.matrices, self.version)
+
+
+def from_dataframe(df, hash_types=HASH_TYPES) -> tuple:
+    """Get the ids and packed matrices of a DataFrame of ImageHash columns"""
+    index = HashIndex.from_dataframe(df, hash_types)
+    return index.ids.tolist(), index.matrices
+
+
+def from_csv(path: str, hash_types=HASH_TYPES) -> tuple:
+    """Get the ids and packed matrices of a CSV of hex encoded hashes
+
+    Args:
+        path (string): CSV with an 'id' column and one hex column per hash type,
+            like card_hashes8b.csv
+        hash_types (tuple): Hash columns to read, missing ones are skipped
+    Returns:
+        tuple: (ids, matrices keyed by hash type)
+    """
+    import pandas as pd
+
+    df = pd.read_csv(path, dtype=str)
+    matrices = {}
+    for hash_type in hash_types:
+        if hash_type in df.columns:
+            raw = b"".join(bytes.fromhex(value) for value in df[hash_type])
+            words = len(df[hash_type].iloc[0]) // 16
+            matrices[hash_type] = np.frombuffer(raw, dtype=">u8").reshape(-1, words).astype(np.uint64)
+    return df["id"].tolist(), matrices
+
+
+def convert(source: str, output: str) -> "HashDB":
+    """Convert a pickled DataFrame or a hex CSV of hashes into a hash database
+
+    Args:
+        source (string): .pickle/.pkl or .csv file
+        output (string): Hash database file to write
+    Returns:
+        HashDB: The written database
+    """
+    if source.endswith(".csv"):
+        ids, matrices = from_csv(source)
+    else:
+        import pandas as pd
+
+        ids, matrices = from_dataframe(pd.read_pickle(source))
+    write(output, ids, matrices, {"source": os.path.basename(source)})
+    return HashDB(output)
+
+
+def segment_dir(path: str) -> str:
+    """Directory holding the delta segments appended to a hash database"""
+    return f"{path}.d"
+
+
+def segment_paths(path: str) -> list:
+    """Delta segment files of a hash database, oldest first"""
+    return sorted(glob.glob(os.path.join(segment_dir(path), "*.cardhash")))
+
+
+def open_all(path: str = DEFAULT_PATH, segments: bool = True) -> list:
+    """Open a hash database and its delta segments
+
+    Args:
+        path (string): Base hash database file, which may not exist yet
+        segments (bool): Whether to open the delta segments too
+    Returns:
+        list of HashDB: The base database first, then every segment
+    """
+    paths = [path] if os.path.exists(path) else []
+    if segments:
+        paths += segment_paths(path)
+    return [HashDB(p) for p in paths]
+
+
+def merge(dbs) -> tuple:
+    """Concatenate several hash databases, later rows replacing earlier ones
+
+    Args:
+        dbs (list of HashDB): Databases with the same hash types
+    Returns:
+        tuple: (ids, matrices keyed by hash type)
+    Raises:
+        HashDBError: If a database doesn't have the same hash types and
+            sizes as the first one
+    """
+    expected = {name: matrix.shape[1] for name, matrix in dbs[0].matrices.items()}
+    for db in dbs[1:]:
+        found = {name: matrix.shape[1] for name, matrix in db.matrices.items()}
+        if found != expected:
+            raise HashDBError(
+                f"{db.path} has the hash types (words per hash) {found}, {dbs[0].path} has {expected}"
+            )
+    ids = [card_id for db in dbs for card_id in db.ids]
+    matrices = {name: np.concatenate([db.matrices[name] for db in dbs]) for name in expected}
+
+    # Keep only the last row of every id
+    last = {card_id: row for row, card_id in enumerate(ids)}
+    if len(last) < len(ids):
+        rows = np.array(sorted(last.values()))
+        ids = [ids[row] for row in rows]
+        matrices = {name: matrix[rows] for name, matrix in matrices.items()}
+    return ids, matrices
+
+
+def load_index(
+    path: str = DEFAULT_PATH, pickle_path: str = DEFAULT_PICKLE_PATH, segments: bool = True
+) -> HashIndex:
+    """Load the card hash index, preferring the memory-mapped database
+
+    A database without delta segments is used in place; segments are
+    merged into an in-memory copy until they are compacted.
+
+    Args:
+        path (string): Hash database file
+        pickle_path (string): Pickled DataFrame used when the database doesn't exist
+        segments (bool): Whether to merge the delta segments, False for the base only
+    Returns:
+        HashIndex: Index over every card hash
+    """
+    dbs = open_all(path, segments)
+    if len(dbs) == 1:
+        return dbs[0].to_index()
+    if dbs:
+        version = "+".join(db.version for db in dbs)
+        return HashIndex(*merge(dbs), version=version)
+
+    import pandas as pd
+
+    index = HashIndex.from_dataframe(pd.read_pickle(pickle_path))
+    index.version = f"{os.path.basename(pickle_path)}@{int(os.path.getmtime(pickle_path))}"
+    return index
+
+
+def signature(path: str = DEFAULT_PATH, pickle_path: str = DEFAULT_PICKLE_PATH) -> tuple:
+    """Cheap fingerprint of the files load_index reads, to notice when they change
+
+    Args:
+        path (string): Hash database file
+        pickle_path (string): Pickled DataFrame fallback
+    Returns:
+        tuple: (path, mtime, size) of every file that exists
+    """
+    fingerprint = []
+    for file_path in [path, *segment_paths(path), pickle_path]:
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            continue
+        fingerprint.append((file_path, stat.st_mtime_ns, stat.st_size))
+    return tuple(fingerprint)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory-mapped card hash database")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="Convert a pickle or hex CSV")
+    convert_parser.add_argument("source", help="card_hashes_32b.pickle or card_hashes8b.csv")
+    convert_parser.add_argument("output", nargs="?", default=DEFAULT_PATH)
+    info_parser = subparsers.add_parser("info", help="Describe a hash database")
+    info_parser.add_argument("path", nargs="?", default=DEFAULT_PATH)
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        db = convert(args.source, args.output)
+        print(f"Wrote {len(db)} cards to {args.output}")
+    else:
+        db = HashDB(args.path)
+        print(json.dumps(dict(db.metadata, ids=len(db)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
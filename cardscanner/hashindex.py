@@ -0,0 +1,245 @@
+import numpy as np
+
+HASH_TYPES = ("perceptual", "difference", "wavelet")
+
+# Upper bound on the XOR scratch of one block of queries in distances_many
+MAX_BLOCK_BYTES = 32 * 1024 * 1024
+
+# SWAR popcount constants, used when numpy has no native bitwise_count
+_M1 = np.uint64(0x5555555555555555)
+_M2 = np.uint64(0x3333333333333333)
+_M4 = np.uint64(0x0F0F0F0F0F0F0F0F)
+_H01 = np.uint64(0x0101010101010101)
+
+
+def pack_hash(image_hash) -> np.ndarray:
+    """Pack an image hash into a row of uint64 words
+
+    The bits are packed most significant first, so the words read in the
+    same order as the hex string of the hash.
+
+    Args:
+        image_hash (ImageHash or np.ndarray): Hash to pack. Arrays of dtype
+            uint64 are assumed to be packed already and are returned as is.
+    Returns:
+        np.ndarray: 1-d uint64 array
+    """
+    if isinstance(image_hash, np.ndarray) and image_hash.dtype == np.uint64:
+        return image_hash
+    bits = np.asarray(getattr(image_hash, "hash", image_hash), dtype=bool).ravel()
+    packed = np.packbits(bits)
+    padding = -len(packed) % 8
+    if padding:
+        packed = np.concatenate([packed, np.zeros(padding, dtype=np.uint8)])
+    return packed.view(">u8").astype(np.uint64)
+
+
+def popcount(words: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """Count the set bits of every uint64 word
+
+    Args:
+        words (np.ndarray): uint64 array of any shape
+        out (np.ndarray): Optional buffer for the counts. Without numpy's
+            bitwise_count the counting happens in place in ``words``, and
+            ``out`` must then be a uint64 buffer of the same shape.
+    Returns:
+        np.ndarray: Array of the same shape with the bit count of each word
+    """
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words, out=out)
+    if out is None:
+        x = words - ((words >> np.uint64(1)) & _M1)
+        x = (x & _M2) + ((x >> np.uint64(2)) & _M2)
+        x = (x + (x >> np.uint64(4))) & _M4
+        return (x * _H01) >> np.uint64(56)
+    x, t = words, out
+    np.right_shift(x, np.uint64(1), out=t)
+    np.bitwise_and(t, _M1, out=t)
+    np.subtract(x, t, out=x)
+    np.right_shift(x, np.uint64(2), out=t)
+    np.bitwise_and(t, _M2, out=t)
+    np.bitwise_and(x, _M2, out=x)
+    np.add(x, t, out=x)
+    np.right_shift(x, np.uint64(4), out=t)
+    np.add(x, t, out=x)
+    np.bitwise_and(x, _M4, out=x)
+    np.multiply(x, _H01, out=x)
+    np.right_shift(x, np.uint64(56), out=t)
+    return t
+
+
+class Workspace:
+    """Reusable scratch buffers for distance computations
+
+    A workspace must only be used by one thread at a time, the arrays it
+    hands out are overwritten by the next call that asks for them.
+    """
+
+    def __init__(self):
+        self.buffers = {}
+
+    def get(self, key: str, shape: tuple, dtype) -> np.ndarray:
+        """Get a buffer, allocating it only when the shape or dtype changes
+
+        Args:
+            key (string): Buffer name
+            shape (tuple): Required shape
+            dtype: Required dtype
+        Returns:
+            np.ndarray: Uninitialized buffer
+        """
+        buffer = self.buffers.get(key)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self.buffers[key] = buffer
+        return buffer
+
+
+class HashSizeError(ValueError):
+    """Raised when a query hash doesn't have as many bits as the indexed hashes"""
+
+
+class HashIndex:
+    """Packed-bit Hamming index over the card hash database
+
+    Every hash column is stored as a contiguous (cards, words) uint64
+    matrix, so a distance computation is one XOR and one popcount over
+    the whole database instead of one ImageHash subtraction per card.
+    """
+
+    def __init__(self, ids, matrices: dict, version: str = None):
+        self.version = version
+        self.ids = np.asarray(ids, dtype=object)
+        self.matrices = {
+            name: np.ascontiguousarray(matrix, dtype=np.uint64)
+            for name, matrix in matrices.items()
+        }
+
+    def freeze(self) -> "HashIndex":
+        """Mark the index arrays read-only so they can be shared between threads"""
+        self.ids.flags.writeable = False
+        for matrix in self.matrices.values():
+            matrix.flags.writeable = False
+        return self
+
+    @classmethod
+    def from_dataframe(cls, df, hash_types=HASH_TYPES) -> "HashIndex":
+        """Build an index from a DataFrame of ImageHash columns
+
+        Args:
+            df (pd.DataFrame): Card hashes with an 'id' column
+            hash_types (tuple): Hash columns to index, missing ones are skipped
+        Returns:
+            HashIndex: Index over the given columns
+        """
+        matrices = {}
+        for hash_type in hash_types:
+            if hash_type in df.columns:
+                matrices[hash_type] = np.stack([pack_hash(h) for h in df[hash_type]])
+        return cls(df["id"].tolist(), matrices)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def hash_types(self) -> list:
+        return list(self.matrices)
+
+    def bits(self, hash_type: str) -> int:
+        """Number of bits stored per hash of the given type"""
+        return self.matrices[hash_type].shape[1] * 64
+
+    def _matrix(self, hash_type: str, words: int) -> np.ndarray:
+        matrix = self.matrices[hash_type]
+        if words != matrix.shape[1]:
+            raise HashSizeError(
+                f"The index holds {matrix.shape[1] * 64}-bit {hash_type} hashes but the query has "
+                f"{words * 64} bits: the hash database was built with another hash size than scans use"
+            )
+        return matrix
+
+    def distances(self, hash_type: str, query, workspace: Workspace = None) -> np.ndarray:
+        """Hamming distance from a query hash to every card
+
+        Args:
+            hash_type (string): Hash column to compare against
+            query (ImageHash or np.ndarray): Query hash
+            workspace (Workspace): Optional scratch buffers to compute in.
+                The returned array then belongs to the workspace.
+        Returns:
+            np.ndarray: Distance to every card, in index order
+        Raises:
+            HashSizeError: If the query hashes don't have as many bits as the indexed ones
+        """
+        query = pack_hash(query)
+        matrix = self._matrix(hash_type, query.size)
+        if workspace is None:
+            xor = np.bitwise_xor(matrix, query)
+            return popcount(xor).sum(axis=1, dtype=np.int64)
+
+        xor = workspace.get("xor", matrix.shape, np.uint64)
+        np.bitwise_xor(matrix, query, out=xor)
+        count_dtype = np.uint8 if hasattr(np, "bitwise_count") else np.uint64
+        counts = popcount(xor, out=workspace.get("counts", matrix.shape, count_dtype))
+        distances = workspace.get("distances", (len(matrix),), np.int64)
+        return np.add.reduce(counts, axis=1, dtype=np.int64, out=distances)
+
+    def row_distances(self, hash_type: str, query, rows: np.ndarray) -> np.ndarray:
+        """Hamming distance from a query hash to some of the cards
+
+        Args:
+            hash_type (string): Hash column to compare against
+            query (ImageHash or np.ndarray): Query hash
+            rows (np.ndarray): Row indices of the cards
+        Returns:
+            np.ndarray: Distance to each of the given cards
+        Raises:
+            HashSizeError: If the query hashes don't have as many bits as the indexed ones
+        """
+        query = pack_hash(query)
+        xor = np.bitwise_xor(self._matrix(hash_type, query.size)[rows], query)
+        return popcount(xor).sum(axis=1, dtype=np.int64)
+
+    def distances_many(self, hash_type: str, queries: np.ndarray) -> np.ndarray:
+        """Hamming distances from several query hashes to every card
+
+        Queries are compared in blocks, each block as a single broadcast
+        XOR over the whole matrix.
+
+        Args:
+            hash_type (string): Hash column to compare against
+            queries (np.ndarray): Packed queries of shape (queries, words)
+        Returns:
+            np.ndarray: int64 array of shape (queries, cards)
+        Raises:
+            HashSizeError: If the query hashes don't have as many bits as the indexed ones
+        """
+        queries = np.asarray(queries, dtype=np.uint64)
+        matrix = self._matrix(hash_type, queries.shape[-1])
+        queries = queries.reshape(-1, matrix.shape[1])
+        distances = np.empty((len(queries), len(matrix)), dtype=np.int64)
+        block = max(1, MAX_BLOCK_BYTES // max(matrix.nbytes, 1))
+        for start in range(0, len(queries), block):
+            xor = np.bitwise_xor(matrix[None, :, :], queries[start : start + block, None, :])
+            distances[start : start + block] = popcount(xor).sum(axis=2, dtype=np.int64)
+        return distances
+
+    def nearest(self, hash_type: str, query, n: int = 5, workspace: Workspace = None):
+        """Find the n cards closest to a query hash
+
+        Args:
+            hash_type (string): Hash column to compare against
+            query (ImageHash or np.ndarray): Query hash
+            n (int): Number of cards to return
+            workspace (Workspace): Optional scratch buffers to compute in
+        Returns:
+            tuple: (row indices sorted by distance, distances of all cards)
+        """
+        distances = self.distances(hash_type, query, workspace)
+        n = max(1, min(n, len(distances)))
+        if n < len(distances):
+            top = np.argpartition(distances, n - 1)[:n]
+        else:
+            top = np.arange(len(distances))
+        top = top[np.argsort(distances[top], kind="stable")]
+        return top, distances
@@ -0,0 +1,154 @@
+from collections.abc import Mapping
+
+import imagehash
+from PIL import Image
+
+# Standard card dimensions every image is cropped to before hashing
+CARD_WIDTH = 600
+CARD_HEIGHT = 825
+
+HASH_SIZE = 32
+PHASH_HIGHFREQ_FACTOR = 8
+
+# Size each hash resizes the card to, as imagehash does on a 600x825 card
+HASH_IMAGE_SIZES = {
+    "perceptual": (HASH_SIZE * PHASH_HIGHFREQ_FACTOR, HASH_SIZE * PHASH_HIGHFREQ_FACTOR),
+    "difference": (HASH_SIZE + 1, HASH_SIZE),
+    "wavelet": (512, 512),
+}
+
+
+def card_box(size: tuple) -> tuple:
+    """Get the centered region of an image with the aspect ratio of a card
+
+    Args:
+        size (tuple): (width, height) of the image
+    Returns:
+        tuple: (left, top, right, bottom) crop box in image coordinates
+    """
+    width, height = size
+    target_ratio = CARD_WIDTH / CARD_HEIGHT
+
+    if width / height > target_ratio:
+        # Image is wider, keep the full height
+        crop_width = height * target_ratio
+        left = (width - crop_width) / 2
+        return (left, 0, left + crop_width, height)
+
+    # Image is taller, keep the full width
+    crop_height = width / target_ratio
+    top = (height - crop_height) / 2
+    return (0, top, width, top + crop_height)
+
+
+def preprocess_image(img: Image) -> Image:
+    """
+    Resize an image to cover the standard card dimensions and crop its center.
+
+    This is the pipeline the hash databases were built with, so it must
+    not change: resampling differently shifts every hash by tens of bits.
+
+    Args:
+        img (PIL.Image): Input image
+
+    Returns:
+        PIL.Image: RGB image of CARD_WIDTH x CARD_HEIGHT
+    """
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+
+    # Fit the shorter side, keeping the aspect ratio
+    if img.width / img.height > CARD_WIDTH / CARD_HEIGHT:
+        new_width, new_height = int(CARD_HEIGHT * img.width / img.height), CARD_HEIGHT
+    else:
+        new_width, new_height = CARD_WIDTH, int(CARD_WIDTH / (img.width / img.height))
+    img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+
+    if new_width > CARD_WIDTH or new_height > CARD_HEIGHT:
+        left = (new_width - CARD_WIDTH) // 2
+        top = (new_height - CARD_HEIGHT) // 2
+        img = img.crop((left, top, left + CARD_WIDTH, top + CARD_HEIGHT))
+    return img
+
+
+class ImageHashes(Mapping):
+    """Lazily computed hashes of one image
+
+    Behaves like the dict ``get_hashes`` used to return, but a hash is only
+    computed the first time it is looked up and is memoized afterwards.
+    The 600x825 card and its grayscale version are made once and shared
+    by every hash, which resizes the grayscale card exactly as imagehash
+    would, so the hashes are bit-identical to the database's.
+    """
+
+    HASHERS = {
+        "perceptual": lambda img: imagehash.phash(img, HASH_SIZE, PHASH_HIGHFREQ_FACTOR),
+        "difference": lambda img: imagehash.dhash(img, HASH_SIZE),
+        "wavelet": lambda img: imagehash.whash(img, HASH_SIZE),
+        "color": imagehash.colorhash,
+    }
+
+    def __init__(self, img: Image):
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        self.img = img
+        self._card = None
+        self._gray = None
+        self._hashes = {}
+
+    @property
+    def card(self) -> Image:
+        """The image as the RGB CARD_WIDTH x CARD_HEIGHT card every hash starts from"""
+        if self._card is None:
+            self._card = preprocess_image(self.img)
+        return self._card
+
+    def resized(self, hash_type: str) -> Image:
+        """Get the card region resized for a hash type
+
+        Args:
+            hash_type (string): Hash type from HASH_IMAGE_SIZES, or 'color'
+        Returns:
+            PIL.Image: Grayscale image, or the RGB card for 'color'
+        """
+        if hash_type == "color":
+            return self.card
+        if self._gray is None:
+            self._gray = self.card.convert("L")
+        return self._gray.resize(HASH_IMAGE_SIZES[hash_type], Image.Resampling.LANCZOS)
+
+    @property
+    def computed(self) -> dict:
+        """Hashes that have been computed so far"""
+        return dict(self._hashes)
+
+    def __getitem__(self, hash_type: str):
+        if hash_type not in self._hashes:
+            if hash_type not in self.HASHERS:
+                raise KeyError(hash_type)
+            self._hashes[hash_type] = self.HASHERS[hash_type](self.resized(hash_type))
+        return self._hashes[hash_type]
+
+    def __iter__(self):
+        return iter(self.HASHERS)
+
+    def __len__(self) -> int:
+        return len(self.HASHERS)
+
+
+def get_hashes(img: Image, hash_types=None) -> ImageHashes:
+    """
+    Calculate hashes for an image on demand.
+
+    Args:
+        img (PIL.Image): Image to calculate hashes for.
+        hash_types (list): Hash types to compute right away. Any other hash
+            is computed the first time it is looked up.
+
+    Returns:
+        ImageHashes: Mapping of hash type (perceptual, difference, wavelet, color) to hash.
+    """
+    hashes = ImageHashes(img)
+    for hash_type in hash_types or ():
+        hashes[hash_type]
+    return hashes
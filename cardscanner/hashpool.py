@@ -0,0 +1,222 @@
+import io
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from cardscanner.decode import decode_image
+from cardscanner.hashindex import pack_hash
+from cardscanner.hashing import ImageHashes
+from cardscanner.localize import localize_image
+
+# Processes that decode and hash uploads, 0 to hash on the request thread. Every web
+# server worker process has its own pool, so by default they share the CPUs between them.
+DEFAULT_WORKERS = int(
+    os.environ.get(
+        "HASH_POOL_WORKERS",
+        max(1, (os.cpu_count() or 1) // max(1, int(os.environ.get("WEB_CONCURRENCY", 1)))),
+    )
+)
+
+# Pool processes start from a clean server process instead of a fork of a threaded
+# web worker, whose children could inherit locks held by its other threads
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+# Modules the fork server imports once for all pool processes, only what a pool task
+# needs instead of relying on it preloading the main module, i.e. the whole web app
+FORKSERVER_PRELOAD = [
+    "cardscanner.decode",
+    "cardscanner.hashing",
+    "cardscanner.localize",
+    "cardscanner.hashpool",
+]
+
+# Most images queued or being hashed at once before requests are turned away
+DEFAULT_MAX_PENDING = int(os.environ.get("HASH_POOL_MAX_PENDING", max(DEFAULT_WORKERS, 1) * 4))
+
+# Seconds a request waits for its hashes before giving up
+DEFAULT_TIMEOUT = float(os.environ.get("HASH_POOL_TIMEOUT", 30))
+
+
+class PoolBusy(RuntimeError):
+    """Raised when the hash pool can't take more work right now"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def hash_cards_stream(stream, hash_types, max_cards: int = 1) -> tuple:
+    """Decode an image, find the cards in it and compute their packed hashes
+
+    Args:
+        stream (file-like): Encoded image
+        hash_types (tuple): Hash types to compute
+        max_cards (int): Most cards to look for
+    Returns:
+        tuple: (list of (packed hashes keyed by hash type, card corners or
+        None when no card outline was found) per card, largest first,
+        seconds spent per stage)
+    """
+    start = time.perf_counter()
+    img = decode_image(stream, "RGB" if "color" in hash_types else "L")
+    decoded = time.perf_counter()
+    cards = localize_image(img, max_cards)
+    localized = time.perf_counter()
+
+    timings = {"decode": decoded - start, "localize": localized - decoded, "resize": 0.0, "hash": 0.0}
+    results = []
+    for card, corners in cards:
+        hashes = ImageHashes(card)
+        packed = {}
+        for hash_type in hash_types:
+            resize_start = time.perf_counter()
+            resized = hashes.resized(hash_type)
+            hash_start = time.perf_counter()
+            packed[hash_type] = pack_hash(ImageHashes.HASHERS[hash_type](resized))
+            timings["resize"] += hash_start - resize_start
+            timings["hash"] += time.perf_counter() - hash_start
+        results.append((packed, corners))
+    return results, timings
+
+
+def hash_image_stream(stream, hash_types) -> tuple:
+    """Decode an image and compute the packed hashes of the card in it
+
+    Args:
+        stream (file-like): Encoded image
+        hash_types (tuple): Hash types to compute
+    Returns:
+        tuple: (packed hashes keyed by hash type, seconds spent per stage)
+    """
+    cards, timings = hash_cards_stream(stream, hash_types)
+    return cards[0][0], timings
+
+
+def hash_cards_bytes(data: bytes, hash_types, max_cards: int) -> tuple:
+    """Find and hash the cards of an image in a pool process
+
+    Only the encoded bytes go in and only the packed uint64 hashes, the
+    card corners and the timings come back out.
+    """
+    return hash_cards_stream(io.BytesIO(data), hash_types, max_cards)
+
+
+class HashPool:
+    """Bounded process pool for the CPU-bound part of a scan
+
+    Decoding, resizing and hashing hold the GIL for most of their time, so
+    they run in worker processes and request threads only wait on them.
+    At most ``max_pending`` images are queued or in progress; past that
+    ``hash_image`` raises PoolBusy with a Retry-After estimate instead of
+    letting requests pile up.
+    """
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        timeout: float = DEFAULT_TIMEOUT,
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        # Moving average of the seconds one image takes in a worker
+        self._service_time = 0.1
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Created on first use, so every forked server worker gets its own pool
+        with self._lock:
+            if self._executor is None:
+                context = multiprocessing.get_context(START_METHOD)
+                if START_METHOD == "forkserver":
+                    context.set_forkserver_preload(FORKSERVER_PRELOAD)
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=context)
+            return self._executor
+
+    def retry_after(self) -> int:
+        """Seconds until a queued image is likely to have been hashed"""
+        return max(1, math.ceil(self._service_time * self.max_pending / max(self.workers, 1)))
+
+    def hash_cards(self, upload, hash_types, max_cards: int = 1) -> tuple:
+        """Decode an image, find its cards and hash them on the pool
+
+        Args:
+            upload (bytes or file-like): Encoded image. A stream is read
+                in place when hashing on the request thread.
+            hash_types (tuple): Hash types to compute
+            max_cards (int): Most cards to look for
+        Returns:
+            tuple: (list of (packed hashes keyed by hash type, card corners
+            or None) per card, seconds spent per stage, including 'queue'
+            for the wait for a worker)
+        Raises:
+            PoolBusy: If too many images are pending or the hashes take
+                longer than the timeout
+            ImageTooLarge: If the image has too many pixels
+        """
+        if self.workers <= 0:
+            stream = io.BytesIO(upload) if isinstance(upload, bytes) else upload
+            return hash_cards_stream(stream, tuple(hash_types), max_cards)
+
+        if not self._slots.acquire(blocking=False):
+            raise PoolBusy("Too many scans in progress", self.retry_after())
+        try:
+            start = time.perf_counter()
+            data = upload if isinstance(upload, bytes) else upload.read()
+            future = self._get_executor().submit(hash_cards_bytes, data, tuple(hash_types), max_cards)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is only free once the worker is, even if this request gave up waiting on it
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            cards, timings = future.result(self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise PoolBusy("Timed out waiting for the image to be hashed", self.retry_after())
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory), start a fresh pool for the next scan
+            with self._lock:
+                self._executor = None
+            raise
+        elapsed = time.perf_counter() - start
+
+        service_time = sum(timings.values())
+        self._service_time = 0.8 * self._service_time + 0.2 * service_time
+        timings["queue"] = max(0.0, elapsed - service_time)
+        return cards, timings
+
+    def hash_image(self, upload, hash_types) -> tuple:
+        """Decode and hash the card of an image on the pool
+
+        Same as ``hash_cards`` for a single card, returning only its hashes
+        and the timings.
+        """
+        cards, timings = self.hash_cards(upload, hash_types)
+        return cards[0][0], timings
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+def server_timing(timings: dict) -> str:
+    """Format stage timings as a Server-Timing header value
+
+    Args:
+        timings (dict): Seconds spent per stage
+    Returns:
+        string: e.g. 'decode;dur=12.3, hash;dur=4.5'
+    """
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
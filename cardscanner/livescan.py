@@ -0,0 +1,182 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+# Seconds between two frames sampled from the camera
+DEFAULT_INTERVAL = float(os.environ.get("LIVE_SCAN_INTERVAL", 0.2))
+
+# Hash type live scans are matched with, fused confidences are calibrated
+DEFAULT_HASH_TYPE = os.environ.get("LIVE_SCAN_HASH_TYPE", "fused")
+
+# Lowest confidence of a best match for a card to be reported
+DEFAULT_MIN_CONFIDENCE = float(os.environ.get("LIVE_SCAN_MIN_CONFIDENCE", 0.5))
+
+# Most bits of the 64-bit motion hash that may change between two frames of a still scene
+DEFAULT_MOTION_BITS = int(os.environ.get("LIVE_SCAN_MOTION_BITS", 6))
+
+
+def motion_hash(frame: np.ndarray) -> int:
+    """64-bit difference hash of a frame, cheap enough to run on every sample
+
+    Args:
+        frame (np.ndarray): BGR or grayscale frame, or anything np.asarray takes
+    Returns:
+        int: Hash, comparable with ``bin(a ^ b).count("1")``
+    """
+    frame = np.asarray(frame)
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(frame, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class LiveRecognizer:
+    """Background loop recognizing the card held in front of the camera
+
+    Frames are sampled every ``interval`` seconds and reduced to a 64-bit
+    motion hash first. A frame is only matched once the scene has stopped
+    moving, i.e. its motion hash is within ``motion_bits`` of the previous
+    sample's, and only once per still scene: the following still frames
+    are skipped until the scene moves again. Each match of a still scene
+    is published as the latest result, and ``wait`` lets any number of
+    listeners block until the result changes. The loop only samples
+    frames while at least one listener is registered with ``listening``,
+    so the camera isn't read for nobody.
+
+    ``grab`` returns the current camera frame as an np.ndarray or a
+    camera Frame, or None when there is none. ``recognize`` takes a frame and returns its
+    matches as (card id, confidence) pairs, best match first. A best match
+    below ``min_confidence`` is reported as no card.
+    """
+
+    def __init__(
+        self,
+        grab,
+        recognize,
+        interval: float = DEFAULT_INTERVAL,
+        min_confidence: float = DEFAULT_MIN_CONFIDENCE,
+        motion_bits: int = DEFAULT_MOTION_BITS,
+        log=print,
+    ):
+        self.grab = grab
+        self.recognize = recognize
+        self.interval = interval
+        self.min_confidence = min_confidence
+        self.motion_bits = motion_bits
+        self.log = log
+        self.frames = 0
+        self.recognized = 0
+        self._changed = threading.Condition()
+        self._result = {"seq": 0, "card_id": None, "confidence": None, "matches": []}
+        self._stop = threading.Event()
+        self._thread = None
+        self._listeners = 0
+
+    def start(self):
+        """Start the loop if it isn't running yet"""
+        with self._changed:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="live-scan", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Stop the loop after the current frame"""
+        self._stop.set()
+        with self._changed:
+            self._changed.notify_all()
+
+    @contextmanager
+    def listening(self):
+        """Keep the loop sampling frames for as long as the block runs
+
+        Starts the loop if it isn't running yet. Once the last listener
+        leaves, the loop pauses until the next one arrives.
+        """
+        with self._changed:
+            self._listeners += 1
+            self._changed.notify_all()
+        self.start()
+        try:
+            yield self
+        finally:
+            with self._changed:
+                self._listeners -= 1
+
+    @property
+    def result(self) -> dict:
+        """Latest published result"""
+        with self._changed:
+            return self._result
+
+    def wait(self, seq: int, timeout: float = None) -> dict:
+        """Wait for a result newer than the one a listener already has
+
+        Args:
+            seq (int): ``seq`` of the last result seen, 0 for none
+            timeout (float): Seconds to wait at most
+        Returns:
+            dict: Latest result, which is still ``seq`` on a timeout
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self._result["seq"] != seq, timeout)
+            return self._result
+
+    def status(self) -> dict:
+        """Counters of the loop"""
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "listeners": self._listeners,
+            "frames": self.frames,
+            "recognized": self.recognized,
+            "seq": self.result["seq"],
+        }
+
+    def _publish(self, matches: list):
+        card_id, confidence = matches[0] if matches else (None, None)
+        if confidence is not None and confidence < self.min_confidence:
+            card_id = None
+        with self._changed:
+            if card_id == self._result["card_id"]:
+                return
+            self._result = {
+                "seq": self._result["seq"] + 1,
+                "card_id": card_id,
+                "confidence": confidence if card_id else None,
+                "matches": matches if card_id else [],
+                "updated_at": time.time(),
+            }
+            self._changed.notify_all()
+
+    def _run(self):
+        previous = None
+        done = False
+        while not self._stop.wait(self.interval):
+            with self._changed:
+                if not self._listeners:
+                    self._changed.wait_for(lambda: self._listeners or self._stop.is_set())
+                    # The scene before the pause tells nothing about the one after it
+                    previous = None
+                    done = False
+            try:
+                frame = self.grab()
+                if frame is None:
+                    continue
+                self.frames += 1
+                current = motion_hash(frame)
+                still = previous is not None and bin(current ^ previous).count("1") <= self.motion_bits
+                previous = current
+                if not still:
+                    done = False
+                    continue
+                if done:
+                    continue
+                done = True
+                self.recognized += 1
+                self._publish(self.recognize(frame))
+            except Exception as e:
+                self.log(f"Live scan failed: {e}")
@@ -0,0 +1,172 @@
+import os
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from cardscanner.hashing import CARD_HEIGHT, CARD_WIDTH
+
+# Set to 0 to hash the centered card region of images instead of looking for the card
+LOCALIZE_CARDS = os.environ.get("CARD_LOCALIZATION", "1") != "0"
+
+# Longest side images are shrunk to before looking for card outlines
+DETECTION_SIZE = 640
+
+# Smallest and largest share of the image a card outline may cover. An
+# outline covering nearly the whole image is the image of a single card
+# already, which is hashed as it is.
+MIN_CARD_AREA = 0.08
+MAX_CARD_AREA = 0.9
+
+# Smallest area of further cards in the same image, relative to the largest
+MIN_AREA_RATIO = 0.5
+
+# Width / height of a card, and how far the aspect of a detected outline may
+# stray from it, relative to it. Artwork frames and text boxes are far off.
+CARD_ASPECT = CARD_WIDTH / CARD_HEIGHT
+ASPECT_TOLERANCE = 0.2
+
+# Images whose own aspect is this close to a card's, relative to it, already are
+# a card crop, like every image the hash database was built from. Their inner
+# panel would pass for a card outline, so they are hashed as they are.
+CROP_ASPECT_TOLERANCE = 0.02
+
+# Pixels of the detection image a card corner may lie outside of it
+CORNER_MARGIN = 2
+
+# Outline approximation precision, relative to the outline's perimeter
+APPROX_EPSILON = 0.02
+
+
+def order_corners(quad: np.ndarray) -> np.ndarray:
+    """Order the corners of a quadrilateral clockwise from the top-left
+
+    Args:
+        quad (np.ndarray): 4x2 corner coordinates in any order
+    Returns:
+        np.ndarray: 4x2 float32 corners, top-left, top-right, bottom-right,
+        bottom-left
+    """
+    quad = quad.reshape(4, 2).astype(np.float32)
+    # Sort by angle around the center, which gives a consistent winding
+    center = quad.mean(axis=0)
+    angles = np.arctan2(quad[:, 1] - center[1], quad[:, 0] - center[0])
+    quad = quad[np.argsort(angles)]
+    # Start at the corner closest to the image origin
+    return np.roll(quad, -int(np.argmin(quad.sum(axis=1))), axis=0)
+
+
+def _is_card(quad: np.ndarray, min_area: float, max_area: float, size: tuple) -> bool:
+    # The enclosing rectangle of a contour cut by the image border can stick out of it
+    width, height = size
+    if (quad < -CORNER_MARGIN).any() or (quad[:, 0] > width + CORNER_MARGIN).any():
+        return False
+    if (quad[:, 1] > height + CORNER_MARGIN).any():
+        return False
+    if not min_area <= cv2.contourArea(quad) <= max_area:
+        return False
+    if not cv2.isContourConvex(quad):
+        return False
+    sides = np.linalg.norm(quad - np.roll(quad, -1, axis=0), axis=1)
+    width, height = (sides[0] + sides[2]) / 2, (sides[1] + sides[3]) / 2
+    # Only portrait outlines: a landscape one is more likely the artwork frame of a card
+    return abs(width / height / CARD_ASPECT - 1) <= ASPECT_TOLERANCE
+
+
+def find_cards(image: np.ndarray, max_cards: int = 1) -> list:
+    """Find the outlines of cards in an image
+
+    The image is shrunk to DETECTION_SIZE, its edges found with Canny and
+    closed with a dilation, and the external contours approximated by
+    polygons. Convex quadrilaterals inside the image with the area and
+    the aspect ratio of a portrait card are kept, largest first; outlines inside an already
+    kept card, e.g. its artwork frame, are skipped. Once a card is found,
+    further cards need at least half its area.
+
+    Args:
+        image (np.ndarray): BGR or grayscale image
+        max_cards (int): Most cards to return
+    Returns:
+        list of np.ndarray: 4x2 float32 corners of each card in image
+        coordinates, ordered by ``order_corners``, largest card first
+    """
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    height, width = image.shape
+    scale = min(1.0, DETECTION_SIZE / max(height, width))
+    small = cv2.resize(image, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+
+    small = cv2.GaussianBlur(small, (5, 5), 0)
+    median = float(np.median(small))
+    edges = cv2.Canny(small, int(max(0, 0.66 * median)), int(min(255, 1.33 * median)))
+    edges = cv2.dilate(edges, np.ones((3, 3), np.uint8))
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    image_area = float(small.shape[0] * small.shape[1])
+    min_area, max_area = MIN_CARD_AREA * image_area, MAX_CARD_AREA * image_area
+    cards = []
+    for contour in sorted(contours, key=cv2.contourArea, reverse=True):
+        if cv2.contourArea(contour) < min_area:
+            break
+        quad = cv2.approxPolyDP(contour, APPROX_EPSILON * cv2.arcLength(contour, True), True)
+        if len(quad) != 4:
+            # Rounded or partly hidden corners, fall back to the enclosing rectangle
+            quad = cv2.boxPoints(cv2.minAreaRect(contour))
+        quad = order_corners(quad)
+        if not _is_card(quad, min_area, max_area, (small.shape[1], small.shape[0])):
+            continue
+        center = tuple(float(c) for c in quad.mean(axis=0))
+        if any(cv2.pointPolygonTest(card, center, False) >= 0 for card in cards):
+            continue
+        cards.append(quad)
+        if len(cards) == 1:
+            min_area = MIN_AREA_RATIO * cv2.contourArea(quad)
+        if len(cards) == max_cards:
+            break
+    return [card / scale for card in cards]
+
+
+def warp_card(image: np.ndarray, quad: np.ndarray, size: tuple = (CARD_WIDTH, CARD_HEIGHT)) -> np.ndarray:
+    """Perspective correct a card to the canonical card rectangle
+
+    Args:
+        image (np.ndarray): Image the card was found in
+        quad (np.ndarray): Corners as returned by ``find_cards``
+        size (tuple): (width, height) of the result
+    Returns:
+        np.ndarray: The card, size[0] x size[1]
+    """
+    width, height = size
+    target = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]], dtype=np.float32)
+    matrix = cv2.getPerspectiveTransform(quad.astype(np.float32), target)
+    return cv2.warpPerspective(image, matrix, size, flags=cv2.INTER_LINEAR)
+
+
+def localize_image(img: Image, max_cards: int = 1) -> list:
+    """Cut the cards out of an image, perspective corrected
+
+    Args:
+        img (PIL.Image): Photo or camera frame
+        max_cards (int): Most cards to return
+    Returns:
+        list of tuple: (PIL.Image of CARD_WIDTH x CARD_HEIGHT, 4x2 corners
+        as a list) per card, largest first. Without any card outline, for
+        an image that already is a card crop, or with localization
+        disabled, the image itself with None corners, so that it gets the
+        centered crop hashing always did.
+    """
+    if not LOCALIZE_CARDS:
+        return [(img, None)]
+    if abs(img.width / img.height / CARD_ASPECT - 1) <= CROP_ASPECT_TOLERANCE:
+        return [(img, None)]
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    pixels = np.asarray(img)
+    gray = pixels if pixels.ndim == 2 else cv2.cvtColor(pixels, cv2.COLOR_RGB2GRAY)
+    quads = find_cards(gray, max_cards)
+    if not quads:
+        return [(img, None)]
+    return [
+        (Image.fromarray(warp_card(pixels, quad)), np.round(quad, 1).tolist())
+        for quad in quads
+    ]
@@ -0,0 +1,186 @@
+import threading
+
+import numpy as np
+
+from cardscanner.hashindex import HashIndex, Workspace
+
+# Cascade stages of the fused matcher, in order, with the weight of each
+# hash type in the fused distance. The wavelet hash separates rescans of
+# a card from other cards far better than the 1024-bit perceptual hash,
+# so it runs before it and usually ends the cascade.
+FUSED_WEIGHTS = {
+    "difference": 0.25,
+    "wavelet": 0.5,
+    "perceptual": 0.25,
+}
+
+# Cards the difference hash prefilter keeps for re-ranking
+SHORTLIST_SIZE = 64
+
+# Stop the cascade once the runner-up is this much farther than the best
+# match, in fused distance (fraction of differing bits)
+EARLY_EXIT_MARGIN = 0.12
+
+# Logistic mapping from fused distance to confidence. Rescans of the same
+# card land well below the midpoint, unrelated cards sit near 0.5.
+CONFIDENCE_MIDPOINT = 0.25
+CONFIDENCE_SLOPE = 30.0
+
+
+def fused_confidence(distance):
+    """Calibrated match confidence of a fused distance
+
+    Args:
+        distance (float or np.ndarray): Fraction of differing bits
+    Returns:
+        float or np.ndarray: Confidence between 0 and 1
+    """
+    return 1 / (1 + np.exp(CONFIDENCE_SLOPE * (np.asarray(distance) - CONFIDENCE_MIDPOINT)))
+
+
+class CardMatcher:
+    """Thread-safe card matcher over a read-only HashIndex
+
+    The index is frozen when the matcher is created and never written to
+    again. Every thread gets its own Workspace, so concurrent scans reuse
+    their scratch buffers without seeing each other's distances.
+    """
+
+    def __init__(self, index: HashIndex, default_hash_type: str = "perceptual"):
+        self.index = index.freeze()
+        self.default_hash_type = default_hash_type
+        self._local = threading.local()
+
+    @property
+    def workspace(self) -> Workspace:
+        """Scratch buffers of the calling thread"""
+        workspace = getattr(self._local, "workspace", None)
+        if workspace is None:
+            workspace = self._local.workspace = Workspace()
+        return workspace
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def most_similar(self, hashes, hash_type: str = "perceptual", n: int = 5) -> list:
+        """Find the cards most similar to a set of query hashes
+
+        Args:
+            hashes (dict): Query hashes keyed by hash type
+            hash_type (string): Hash type to rank by, or 'fused' for the
+                cascade of ``most_similar_fused``. Unknown types, and 'fused'
+                when the index has none of its hash types, fall back to the
+                matcher's default hash type.
+            n (int): Number of cards to return
+        Returns:
+            list of tuple: (card id, confidence) pairs, best match first
+        """
+        if hash_type == "fused" and self.fused_hash_types:
+            return self.most_similar_fused(hashes, n)
+        if hash_type not in self.index.matrices:
+            hash_type = self.default_hash_type
+        top_indices, distances = self.index.nearest(
+            hash_type, hashes[hash_type], n, self.workspace
+        )
+        return self._rank(top_indices, distances)
+
+    def most_similar_many(self, queries, hash_type: str = "perceptual", n: int = 5) -> list:
+        """Find the most similar cards for several images in one pass
+
+        Args:
+            queries (np.ndarray): Packed query hashes of shape (images, words),
+                as returned by ``hash_batch``. For 'fused', the dict of packed
+                hashes keyed by hash type that ``hash_batch`` returns.
+            hash_type (string): Hash type the queries were computed with
+            n (int): Number of cards to return per image
+        Returns:
+            list of list of tuple: (card id, confidence) pairs per image
+        """
+        if hash_type == "fused":
+            count = len(next(iter(queries.values()))) if queries else 0
+            return [
+                self.most_similar_fused({t: packed[i] for t, packed in queries.items()}, n)
+                for i in range(count)
+            ]
+        distances = self.index.distances_many(hash_type, queries)
+        n = max(1, min(n, distances.shape[1]))
+        if n < distances.shape[1]:
+            top = np.argpartition(distances, n - 1, axis=1)[:, :n]
+        else:
+            top = np.broadcast_to(np.arange(distances.shape[1]), distances.shape)
+        order = np.argsort(np.take_along_axis(distances, top, axis=1), axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        return [self._rank(top_indices, row) for top_indices, row in zip(top, distances)]
+
+    @property
+    def fused_hash_types(self) -> list:
+        """Hash types the fused cascade uses, in stage order"""
+        return [t for t in FUSED_WEIGHTS if t in self.index.matrices]
+
+    def most_similar_fused(self, hashes, n: int = 5) -> list:
+        """Find the most similar cards with a cascade over several hash types
+
+        The difference hash of every card is compared first and only the
+        closest SHORTLIST_SIZE cards go on. Each later stage adds the
+        weighted distance of one more hash type for the shortlist only,
+        and the cascade stops as soon as the best match leads the
+        runner-up by EARLY_EXIT_MARGIN. With lazy ``get_hashes`` results,
+        hashes of stages that are skipped are never computed.
+
+        Args:
+            hashes (Mapping): Query hashes keyed by hash type
+            n (int): Number of cards to return
+        Returns:
+            list of tuple: (card id, confidence) pairs, best match first.
+            Confidence only depends on the fused distance of the card.
+        Raises:
+            ValueError: If the index has none of the fused hash types
+        """
+        stages = self.fused_hash_types
+        if not stages:
+            raise ValueError(
+                f"The hash index has none of the fused hash types {', '.join(FUSED_WEIGHTS)}, "
+                f"only {', '.join(self.index.matrices)}"
+            )
+        first = stages[0]
+        distances = self.index.distances(first, hashes[first], self.workspace)
+        size = min(max(SHORTLIST_SIZE, n), len(distances))
+        if size < len(distances):
+            shortlist = np.argpartition(distances, size - 1)[:size]
+        else:
+            shortlist = np.arange(len(distances))
+
+        total = distances[shortlist] / self.index.bits(first) * FUSED_WEIGHTS[first]
+        weight = FUSED_WEIGHTS[first]
+        for hash_type in stages[1:]:
+            fused = total / weight
+            if len(fused) > 1:
+                best, runner_up = np.partition(fused, 1)[:2]
+                if runner_up - best >= EARLY_EXIT_MARGIN:
+                    break
+            distances = self.index.row_distances(hash_type, hashes[hash_type], shortlist)
+            total += distances / self.index.bits(hash_type) * FUSED_WEIGHTS[hash_type]
+            weight += FUSED_WEIGHTS[hash_type]
+
+        fused = total / weight
+        order = np.argsort(fused, kind="stable")[:n]
+        confidences = fused_confidence(fused[order])
+        return list(zip(self.index.ids[shortlist[order]].tolist(), confidences.tolist()))
+
+    def _rank(self, top_indices: np.ndarray, distances: np.ndarray) -> list:
+        """Turn the nearest rows of one query into (card id, confidence) pairs"""
+        # Calculate confidence score (lower distance = higher confidence)
+        max_distance = distances.max()
+        top_distances = distances[top_indices]
+        if max_distance:
+            confidences = 1 - (top_distances / max_distance)
+        else:
+            confidences = np.ones(len(top_indices))
+
+        # Keep only high confidence matches (distance < 50% of max) if there are any
+        high_confidence_mask = top_distances < (max_distance * 0.5)
+        if high_confidence_mask.any():
+            top_indices = top_indices[high_confidence_mask]
+            confidences = confidences[high_confidence_mask]
+
+        return list(zip(self.index.ids[top_indices].tolist(), confidences.tolist()))
@@ -0,0 +1,163 @@
+import itertools
+
+import numpy as np
+
+from cardscanner.hashindex import pack_hash, popcount
+
+CHUNK_DTYPES = {8: ">u1", 16: ">u2", 32: ">u4"}
+
+
+class MultiIndexHash:
+    """Exact Hamming k-NN by multi-index hashing
+
+    Every hash is split into m chunks and each chunk gets its own sorted
+    table. By the pigeonhole principle a hash within distance r of the
+    query has at least one chunk within r // m of the query's chunk, so
+    probing every chunk table with all values up to that sub-radius finds
+    every such hash. The candidates are then verified with their full
+    distance, so results are exact.
+
+    Probing grows with the number of chunk values within the sub-radius,
+    so queries that need more than ``max_sub_radius`` fall back to a brute
+    force scan, which keeps results equal to brute force at any radius.
+    """
+
+    def __init__(self, matrix: np.ndarray, chunk_bits: int = 16, max_sub_radius: int = 2):
+        if chunk_bits not in CHUNK_DTYPES:
+            raise ValueError(f"chunk_bits must be one of {sorted(CHUNK_DTYPES)}")
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.uint64)
+        self.chunk_bits = chunk_bits
+        self.max_sub_radius = max_sub_radius
+
+        chunks = self._chunks(self.matrix)
+        self.num_chunks = chunks.shape[1]
+        # One sorted table for every chunk, keyed by (chunk number, chunk value)
+        # so a single searchsorted call probes all of them
+        keys = self._keys(chunks).ravel()
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.rows = (order // self.num_chunks).astype(np.int32)
+        self._masks = {}
+
+    def __len__(self) -> int:
+        return len(self.matrix)
+
+    @property
+    def max_radius(self) -> int:
+        """Largest radius answered without a brute force fallback"""
+        return self.num_chunks * (self.max_sub_radius + 1) - 1
+
+    def _chunks(self, matrix: np.ndarray) -> np.ndarray:
+        dtype = CHUNK_DTYPES[self.chunk_bits]
+        big_endian = matrix.astype(">u8")
+        return big_endian.view(dtype).reshape(len(matrix), -1).astype(dtype[1:])
+
+    def _keys(self, chunks: np.ndarray) -> np.ndarray:
+        offsets = np.arange(self.num_chunks, dtype=np.uint64) << np.uint64(self.chunk_bits)
+        return chunks.astype(np.uint64) | offsets
+
+    def masks(self, sub_radius: int) -> np.ndarray:
+        """Every chunk value with exactly sub_radius bits set"""
+        if sub_radius not in self._masks:
+            values = [
+                sum(1 << bit for bit in bits)
+                for bits in itertools.combinations(range(self.chunk_bits), sub_radius)
+            ]
+            self._masks[sub_radius] = np.array(values, dtype=np.uint64)
+        return self._masks[sub_radius]
+
+    def candidates(self, query_chunks: np.ndarray, sub_radius: int) -> np.ndarray:
+        """Rows with some chunk at exactly sub_radius from the query's chunk
+
+        Args:
+            query_chunks (np.ndarray): Chunks of the query
+            sub_radius (int): Chunk distance to probe
+        Returns:
+            np.ndarray: Row indices, possibly with duplicates
+        """
+        probes = (self._keys(query_chunks[None, :]).T ^ self.masks(sub_radius)).ravel()
+        starts = np.searchsorted(self.keys, probes, side="left")
+        ends = np.searchsorted(self.keys, probes, side="right")
+        lengths = ends - starts
+        hit = lengths > 0
+        starts, lengths = starts[hit], lengths[hit]
+        # Expand every [start, end) range into its positions in one go
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return self.rows[offsets + np.arange(lengths.sum())]
+
+    def distances(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Full Hamming distance from the query to the given rows"""
+        return popcount(self.matrix[rows] ^ query).sum(axis=1, dtype=np.int64)
+
+    def brute_force(self, query, k: int, radius: int = None):
+        """Exact k nearest rows by scanning every row
+
+        Args:
+            query (ImageHash or np.ndarray): Query hash
+            k (int): Number of rows to return
+            radius (int): Largest distance to return, None for no limit
+        Returns:
+            tuple: (row indices, distances), sorted by distance then row
+        """
+        query = pack_hash(query)
+        distances = popcount(self.matrix ^ query).sum(axis=1, dtype=np.int64)
+        k = min(k, len(distances))
+        if k < len(distances):
+            # Keep every row tied with the k-th distance so the order is deterministic
+            kth = np.partition(distances, k - 1)[k - 1]
+            rows = np.flatnonzero(distances <= kth)
+        else:
+            rows = np.arange(len(distances))
+        if radius is not None:
+            rows = rows[distances[rows] <= radius]
+        order = np.lexsort((rows, distances[rows]))[:k]
+        return rows[order], distances[rows[order]]
+
+    def nearest(self, query, k: int = 5, radius: int = None):
+        """Exact k nearest rows within a radius of a query hash
+
+        Probes the chunk tables one sub-radius at a time and stops as soon
+        as k rows are known to be the closest. Rows farther than the radius
+        are never returned, exactly as brute_force with the same radius.
+
+        Args:
+            query (ImageHash or np.ndarray): Query hash
+            k (int): Number of rows to return
+            radius (int): Largest distance to return, max_radius by default.
+                Radii beyond max_radius are answered by a brute force scan.
+        Returns:
+            tuple: (row indices, distances), sorted by distance then row
+        """
+        radius = self.max_radius if radius is None else radius
+        if radius // self.num_chunks > self.max_sub_radius:
+            return self.brute_force(query, k, radius)
+
+        query = pack_hash(query)
+        query_chunks = self._chunks(query[None, :])[0]
+        rows = np.empty(0, dtype=np.int32)
+        distances = np.empty(0, dtype=np.int64)
+
+        for sub_radius in range(radius // self.num_chunks + 1):
+            found = np.setdiff1d(self.candidates(query_chunks, sub_radius), rows)
+            rows = np.concatenate([rows, found])
+            distances = np.concatenate([distances, self.distances(query, found)])
+
+            # Every row within this radius has been found by now
+            if (distances <= min(radius, self.num_chunks * (sub_radius + 1) - 1)).sum() >= k:
+                break
+
+        within = distances <= radius
+        rows, distances = rows[within], distances[within]
+        order = np.lexsort((rows, distances))[:k]
+        return rows[order], distances[order]
+
+    def within(self, query, radius: int):
+        """Every row within a Hamming radius of a query hash
+
+        Args:
+            query (ImageHash or np.ndarray): Query hash
+            radius (int): Largest distance to return
+        Returns:
+            tuple: (row indices, distances), sorted by distance then row
+        """
+        return self.nearest(query, len(self), radius)
@@ -0,0 +1,150 @@
+import os
+import threading
+from datetime import datetime, timezone
+
+from cardscanner import hashdb
+from cardscanner.hashindex import HashIndex, HashSizeError
+from cardscanner.hashing import HASH_SIZE
+from cardscanner.matcher import CardMatcher
+
+# Seconds between checks of the hash database files, 0 to never reload
+DEFAULT_RELOAD_INTERVAL = float(os.environ.get("HASH_DB_RELOAD_INTERVAL", 30))
+
+
+class ReloadingMatcher:
+    """CardMatcher that picks up a changed hash database without a restart
+
+    A background thread checks the database, its delta segments and the
+    pickle fallback for changes. When they change, the new index is
+    loaded on that thread and swapped in with a single reference
+    assignment, under a new generation number. Scans that already hold
+    the previous matcher finish on it; the next call gets the new one.
+
+    Attribute access is forwarded to the current CardMatcher, so this can
+    be used wherever a CardMatcher is. ``loader`` builds an index from the
+    database and pickle paths, ``hashdb.load_index`` by default.
+
+    An index whose hashes don't have the HASH_SIZE squared bits scans
+    compute is never served: it raises HashSizeError at startup, and a
+    reload to it keeps the current generation.
+    """
+
+    def __init__(
+        self,
+        path: str = hashdb.DEFAULT_PATH,
+        pickle_path: str = hashdb.DEFAULT_PICKLE_PATH,
+        interval: float = DEFAULT_RELOAD_INTERVAL,
+        log=print,
+        loader=hashdb.load_index,
+    ):
+        self.path = path
+        self.pickle_path = pickle_path
+        self.loader = loader
+        self.interval = interval
+        self.log = log
+        self._state = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._signature = hashdb.signature(path, pickle_path)
+        try:
+            index = self._load()
+        except HashSizeError:
+            # Every scan would fail on it, so don't start serving it at all
+            raise
+        except Exception as e:
+            # A broken delta segment shouldn't keep the server from starting on the base index
+            log(f"Could not load the hash database, falling back to the base index: {e}")
+            index = self._load(lambda path, pickle_path: hashdb.load_index(path, pickle_path, segments=False))
+        self._swap(CardMatcher(index))
+
+        self._thread = None
+        if interval > 0:
+            self._thread = threading.Thread(target=self._watch, name="hash-db-reloader", daemon=True)
+            self._thread.start()
+
+    @property
+    def current(self) -> CardMatcher:
+        """Matcher of the current generation, keep it for the whole scan"""
+        return self._state[0]
+
+    @property
+    def generation(self) -> int:
+        """Number of indexes loaded so far, 1 for the one loaded at startup"""
+        return self._state[1]
+
+    def snapshot(self) -> tuple:
+        """The current matcher together with its generation
+
+        Returns:
+            tuple: (CardMatcher, generation)
+        """
+        matcher, generation, _ = self._state
+        return matcher, generation
+
+    def __getattr__(self, name):
+        if name == "_state":
+            raise AttributeError(name)
+        return getattr(self.current, name)
+
+    def __len__(self) -> int:
+        return len(self.current)
+
+    def _load(self, loader=None) -> HashIndex:
+        index = (loader or self.loader)(self.path, self.pickle_path)
+        # Scans hash at HASH_SIZE, an index of another size (e.g. converted from
+        # card_hashes8b.csv) would fail every match of that hash type
+        for hash_type in index.hash_types:
+            if index.bits(hash_type) != HASH_SIZE * HASH_SIZE:
+                raise HashSizeError(
+                    f"The {hash_type} hashes of hash database version {index.version} have "
+                    f"{index.bits(hash_type)} bits, but scans compute {HASH_SIZE * HASH_SIZE}-bit "
+                    f"hashes: rebuild the database at hash size {HASH_SIZE}"
+                )
+        return index
+
+    def _swap(self, matcher: CardMatcher):
+        # The matcher, its generation and load time change together in one assignment
+        with self._lock:
+            generation = self._state[1] + 1 if self._state else 1
+            self._state = (matcher, generation, datetime.now(timezone.utc))
+
+    def reload(self, force: bool = False) -> bool:
+        """Load the hash database again if its files changed
+
+        Args:
+            force (bool): Reload even if nothing changed
+        Returns:
+            bool: Whether a new generation was swapped in
+        """
+        signature = hashdb.signature(self.path, self.pickle_path)
+        if not force and signature == self._signature:
+            return False
+        # Remember the files even if loading fails, so a broken file is only tried once
+        self._signature = signature
+        try:
+            matcher = CardMatcher(self._load())
+        except Exception as e:
+            self.log(f"Could not reload the hash database, keeping generation {self.generation}: {e}")
+            return False
+        self._swap(matcher)
+        self.log(f"Loaded hash database version {matcher.index.version} as generation {self.generation}")
+        return True
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            self.reload()
+
+    def stop(self):
+        """Stop watching the hash database"""
+        self._stopped.set()
+
+    def status(self) -> dict:
+        """Generation, version and size of the index this process is serving"""
+        matcher, generation, loaded_at = self._state
+        return {
+            "generation": generation,
+            "version": matcher.index.version,
+            "cards": len(matcher),
+            "loaded_at": loaded_at.isoformat(),
+            "pid": os.getpid(),
+        }
@@ -0,0 +1,165 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from cardscanner.hashindex import pack_hash, popcount
+
+DEFAULT_MAX_ENTRIES = int(os.environ.get("SCAN_CACHE_ENTRIES", 1024))
+DEFAULT_TTL = float(os.environ.get("SCAN_CACHE_TTL", 600))
+
+# Largest fraction of differing bits for a cached scan to answer a new one
+DEFAULT_NEAR_FRACTION = 0.03
+
+# Bytes hashed at a time when digesting an upload stream
+DIGEST_CHUNK_SIZE = 1024 * 1024
+
+
+def digest_stream(stream) -> str:
+    """SHA-256 of a stream's content, leaving the stream at its start
+
+    Args:
+        stream (file-like): Seekable binary stream
+    Returns:
+        string: Hex digest
+    """
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(DIGEST_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+class ScanCache:
+    """Two-level LRU cache of scan results
+
+    The first level is keyed by the digest of the uploaded bytes and
+    answers exact re-uploads without decoding them. The second level
+    compares the packed hash of a new scan with every cached one and
+    answers near-identical frames within a small Hamming radius, skipping
+    the match and the detail lookups.
+
+    Results are only valid for the index generation they were matched
+    on: the cache empties itself as soon as it is asked about another
+    generation. Entries also expire after a TTL.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl: float = DEFAULT_TTL,
+        near_fraction: float = DEFAULT_NEAR_FRACTION,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.near_fraction = near_fraction
+        self.generation = None
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # (digest, variant) -> (expires, value), in LRU order
+        self._exact = OrderedDict()
+        # variant -> {digest: (expires, packed hash, value)}, in LRU order
+        self._near = {}
+
+    def _check_generation(self, generation):
+        if generation != self.generation:
+            self._exact.clear()
+            self._near.clear()
+            self.generation = generation
+
+    def get(self, digest: str, variant, generation):
+        """Look a scan up by the digest of its upload
+
+        Args:
+            digest (string): Digest of the uploaded bytes
+            variant (tuple): Anything else the result depends on, e.g.
+                the hash type and the number of results
+            generation (int): Generation of the index scans are matched on
+        Returns:
+            object: Cached result, or None
+        """
+        with self._lock:
+            self._check_generation(generation)
+            entry = self._exact.get((digest, variant))
+            if entry is None or entry[0] < time.monotonic():
+                # Every scan goes through here first, so this counts each miss once
+                self.misses += 1
+                return None
+            self._exact.move_to_end((digest, variant))
+            self.hits += 1
+            return entry[1]
+
+    def get_near(self, query, variant, generation):
+        """Look a scan up by its packed hash
+
+        Args:
+            query (ImageHash or np.ndarray): Hash of the new scan
+            variant (tuple): Same as for ``get``
+            generation (int): Generation of the index scans are matched on
+        Returns:
+            object: Result of the closest cached scan within the radius, or None
+        """
+        query = pack_hash(query)
+        with self._lock:
+            self._check_generation(generation)
+            entries = self._near.get(variant)
+            now = time.monotonic()
+            live = [(digest, entry) for digest, entry in entries.items() if entry[0] >= now] if entries else []
+            if not live:
+                return None
+
+            hashes = np.stack([entry[1] for _, entry in live])
+            distances = popcount(hashes ^ query).sum(axis=1, dtype=np.int64)
+            best = int(np.argmin(distances))
+            if distances[best] > self.near_fraction * query.size * 64:
+                return None
+            digest, entry = live[best]
+            entries.move_to_end(digest)
+            self._exact.move_to_end((digest, variant))
+            self.near_hits += 1
+            return entry[2]
+
+    def put(self, digest: str, variant, query, generation, value):
+        """Cache the result of a scan under both levels
+
+        Args:
+            digest (string): Digest of the uploaded bytes
+            variant (tuple): Same as for ``get``
+            query (ImageHash or np.ndarray): Hash of the scan
+            generation (int): Generation of the index the scan was matched on
+            value (object): Result to cache
+        """
+        query = pack_hash(query)
+        with self._lock:
+            self._check_generation(generation)
+            expires = time.monotonic() + self.ttl
+            self._exact[(digest, variant)] = (expires, value)
+            self._exact.move_to_end((digest, variant))
+            entries = self._near.setdefault(variant, OrderedDict())
+            entries[digest] = (expires, query, value)
+            entries.move_to_end(digest)
+
+            while len(self._exact) > self.max_entries:
+                (old_digest, old_variant), _ = self._exact.popitem(last=False)
+                self._near.get(old_variant, {}).pop(old_digest, None)
+
+    def stats(self) -> dict:
+        """Hit and miss counters of the cache
+
+        ``misses`` counts the uploads the exact level didn't know, and
+        ``near_hits`` those of them the near level answered.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "entries": len(self._exact),
+                "generation": self.generation,
+            }
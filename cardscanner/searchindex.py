@@ -0,0 +1,360 @@
+import bisect
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+
+from pokemontcgmanager.querybuilder import Page
+
+# Fields matched word by word, like the API's analyzed text fields
+TEXT_FIELDS = {
+    "name": lambda card: card.get("name"),
+    "set.name": lambda card: card.get("set", {}).get("name"),
+    "set.series": lambda card: card.get("set", {}).get("series"),
+    "artist": lambda card: card.get("artist"),
+}
+
+# Fields matched on their whole value
+KEYWORD_FIELDS = {
+    "id": lambda card: card.get("id"),
+    "set.id": lambda card: card.get("set", {}).get("id"),
+    "set.ptcgoCode": lambda card: card.get("set", {}).get("ptcgoCode"),
+    "number": lambda card: card.get("number"),
+    "rarity": lambda card: card.get("rarity"),
+    "supertype": lambda card: card.get("supertype"),
+    "subtypes": lambda card: card.get("subtypes"),
+    "types": lambda card: card.get("types"),
+    "regulationMark": lambda card: card.get("regulationMark"),
+    "evolvesFrom": lambda card: card.get("evolvesFrom"),
+}
+
+# Fields that also support [low TO high] range queries
+NUMERIC_FIELDS = {
+    "nationalPokedexNumbers": lambda card: card.get("nationalPokedexNumbers"),
+    "hp": lambda card: card.get("hp"),
+}
+
+TOKEN_PATTERN = re.compile(
+    r'\s*(?:(?P<paren>[()])|(?P<neg>-)?(?:(?P<field>[\w.]+):)?'
+    r'(?P<value>"[^"]*"|\[[^\]]*\]|[^\s()]+))'
+)
+WORD_PATTERN = re.compile(r"[\w']+")
+RANGE_PATTERN = re.compile(r"\[\s*(\S+)\s+TO\s+(\S+)\s*\]", re.IGNORECASE)
+
+
+class QuerySyntaxError(ValueError):
+    """Raised for queries the local index can't answer"""
+
+
+def _values(value) -> list:
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _words(text: str) -> list:
+    return WORD_PATTERN.findall(text.lower())
+
+
+def _number(value) -> float or None:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class SearchIndex:
+    """Offline search over the synced card catalog
+
+    Answers the Lucene-style ``field:value`` queries that ``adjust_query``
+    produces and the site uses (quoted phrases, ``*`` prefixes, ``-``
+    negation, ``OR``, parentheses and numeric ``[a TO b]`` ranges) from
+    inverted indexes held in memory. Only card ids live in the index; the
+    cards of a result page are read from the CardStore.
+    """
+
+    def __init__(self, cards, store=None, version=None):
+        self.store = store
+        self.version = version
+        cards = sorted(cards, key=self._sort_key)
+        self.ids = [card["id"] for card in cards]
+        self.all = np.arange(len(cards), dtype=np.int32)
+
+        postings = {field: {} for field in (*TEXT_FIELDS, *KEYWORD_FIELDS, *NUMERIC_FIELDS)}
+        self.text_values = {field: [] for field in TEXT_FIELDS}
+        self.numeric_values = {}
+        name_counts = Counter()
+
+        for doc, card in enumerate(cards):
+            for field, get in TEXT_FIELDS.items():
+                text = " ".join(str(v) for v in _values(get(card)))
+                self.text_values[field].append(" ".join(_words(text)))
+                for word in set(_words(text)):
+                    postings[field].setdefault(word, []).append(doc)
+            for field, get in {**KEYWORD_FIELDS, **NUMERIC_FIELDS}.items():
+                for value in _values(get(card)):
+                    postings[field].setdefault(str(value).lower(), []).append(doc)
+            if card.get("name"):
+                name_counts[card["name"]] += 1
+
+        self.postings = {
+            field: {term: np.array(docs, dtype=np.int32) for term, docs in terms.items()}
+            for field, terms in postings.items()
+        }
+        self.terms = {field: sorted(terms) for field, terms in self.postings.items()}
+        for field in NUMERIC_FIELDS:
+            terms = [(_number(term), term) for term in self.terms[field]]
+            self.numeric_values[field] = sorted(t for t in terms if t[0] is not None)
+
+        self.name_counts = name_counts
+        self.names = sorted((name.lower(), name) for name in name_counts)
+
+    @staticmethod
+    def _sort_key(card: dict) -> tuple:
+        number = card.get("number", "")
+        digits = re.match(r"\d+", number)
+        return (
+            card.get("set", {}).get("releaseDate", ""),
+            card.get("set", {}).get("id", ""),
+            int(digits.group()) if digits else float("inf"),
+            number,
+        )
+
+    @classmethod
+    def from_store(cls, store) -> "SearchIndex":
+        """Build the index from every card in a CardStore"""
+        version = store.catalog_version()
+        return cls(store.iter_cards(), store, version)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def match(self, query: str) -> np.ndarray:
+        """Find the cards matching a query
+
+        Args:
+            query (string): Lucene-style query, empty for every card
+        Returns:
+            np.ndarray: Sorted document numbers of the matching cards
+        Raises:
+            QuerySyntaxError: If the query uses syntax or fields the index
+                doesn't support
+        """
+        tokens = self._tokenize(query or "")
+        if not tokens:
+            return self.all
+        position, docs = self._parse_or(tokens, 0)
+        if position != len(tokens):
+            raise QuerySyntaxError(f"Unexpected ')' in query: {query}")
+        return docs
+
+    def search(self, query: str, page: int = 1, page_size: int = 250) -> Page:
+        """Get one page of the cards matching a query
+
+        Args:
+            query (string): Lucene-style query
+            page (int): Page number
+            page_size (int): Cards per page
+        Returns:
+            Page: Card data of the page with the total number of matches
+        """
+        docs = self.match(query)
+        start = (page - 1) * page_size
+        page_ids = [self.ids[doc] for doc in docs[start : start + page_size]]
+        if self.store is not None:
+            # The index is as old as the catalog it was built from, its cards never expire
+            found = self.store.get_many(page_ids, max_age=None)
+            cards = [found[card_id] for card_id in page_ids if card_id in found]
+        else:
+            cards = [{"id": card_id} for card_id in page_ids]
+        return Page(cards, page, page_size, len(docs))
+
+    def suggest(self, prefix: str, limit: int = 10) -> list:
+        """Typeahead suggestions of card names starting with a prefix
+
+        Args:
+            prefix (string): Start of a card name, case insensitive
+            limit (int): Most suggestions to return
+        Returns:
+            list of string: Card names, most printed first
+        """
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        start = bisect.bisect_left(self.names, (prefix,))
+        matches = []
+        for lower, name in self.names[start:]:
+            if not lower.startswith(prefix):
+                break
+            matches.append(name)
+        matches.sort(key=lambda name: (-self.name_counts[name], name))
+        return matches[:limit]
+
+    def _tokenize(self, query: str) -> list:
+        tokens = []
+        position = 0
+        query = query.strip()
+        while position < len(query):
+            match = TOKEN_PATTERN.match(query, position)
+            if match is None or match.end() == position:
+                raise QuerySyntaxError(f"Can't parse query: {query}")
+            position = match.end()
+            tokens.append(match.groupdict())
+        return tokens
+
+    def _parse_or(self, tokens: list, position: int):
+        position, docs = self._parse_and(tokens, position)
+        while position < len(tokens) and self._is_operator(tokens[position], "OR"):
+            position, other = self._parse_and(tokens, position + 1)
+            docs = np.union1d(docs, other)
+        return position, docs
+
+    def _parse_and(self, tokens: list, position: int):
+        docs = None
+        while position < len(tokens):
+            token = tokens[position]
+            if token["paren"] == ")" or self._is_operator(token, "OR"):
+                break
+            if self._is_operator(token, "AND"):
+                position += 1
+                continue
+            position, other = self._parse_unary(tokens, position)
+            docs = other if docs is None else np.intersect1d(docs, other, assume_unique=True)
+        if docs is None:
+            raise QuerySyntaxError("Empty query clause")
+        return position, docs
+
+    def _parse_unary(self, tokens: list, position: int):
+        token = tokens[position]
+        if token["paren"] == "(":
+            position, docs = self._parse_or(tokens, position + 1)
+            if position >= len(tokens) or tokens[position]["paren"] != ")":
+                raise QuerySyntaxError("Missing ')' in query")
+            return position + 1, docs
+        if token["paren"] == ")":
+            raise QuerySyntaxError("Unexpected ')' in query")
+
+        docs = self._term(token["field"] or "name", token["value"])
+        if token["neg"]:
+            docs = np.setdiff1d(self.all, docs, assume_unique=True)
+        return position + 1, docs
+
+    @staticmethod
+    def _is_operator(token: dict, operator: str) -> bool:
+        return token["field"] is None and not token["neg"] and token["value"] == operator
+
+    def _term(self, field: str, value: str) -> np.ndarray:
+        if field not in self.postings:
+            raise QuerySyntaxError(f"Unsupported field: {field}")
+
+        if value.startswith("["):
+            return self._range(field, value)
+
+        quoted = value.startswith('"')
+        value = value.strip('"').lower()
+        if value == "*":
+            return self.all
+
+        if field in TEXT_FIELDS:
+            words = _words(value)
+            if not words:
+                return self.all[:0]
+            if not quoted and value.endswith("*"):
+                # Every word must match, the last one by prefix
+                docs = self._prefix(field, words[-1])
+                for word in words[:-1]:
+                    docs = np.intersect1d(docs, self._exact(field, word), assume_unique=True)
+                return docs
+            docs = self._exact(field, words[0])
+            for word in words[1:]:
+                docs = np.intersect1d(docs, self._exact(field, word), assume_unique=True)
+            if quoted and len(words) > 1:
+                phrase = " ".join(words)
+                values = self.text_values[field]
+                docs = docs[[f" {phrase} " in f" {values[doc]} " for doc in docs]]
+            return docs
+
+        if not quoted and value.endswith("*"):
+            return self._prefix(field, value[:-1])
+        return self._exact(field, value)
+
+    def _exact(self, field: str, term: str) -> np.ndarray:
+        return self.postings[field].get(term, self.all[:0])
+
+    def _prefix(self, field: str, prefix: str) -> np.ndarray:
+        prefix = prefix.rstrip("*")
+        terms = self.terms[field]
+        start = bisect.bisect_left(terms, prefix)
+        postings = []
+        for term in terms[start:]:
+            if not term.startswith(prefix):
+                break
+            postings.append(self.postings[field][term])
+        return np.unique(np.concatenate(postings)) if postings else self.all[:0]
+
+    def _range(self, field: str, value: str) -> np.ndarray:
+        if field not in NUMERIC_FIELDS:
+            raise QuerySyntaxError(f"Range queries are not supported on {field}")
+        match = RANGE_PATTERN.fullmatch(value)
+        if match is None:
+            raise QuerySyntaxError(f"Can't parse range: {value}")
+        low, high = match.groups()
+        low = float("-inf") if low == "*" else _number(low)
+        high = float("inf") if high == "*" else _number(high)
+        if low is None or high is None:
+            raise QuerySyntaxError(f"Can't parse range: {value}")
+
+        values = self.numeric_values[field]
+        start = bisect.bisect_left(values, (low, ""))
+        postings = []
+        for number, term in values[start:]:
+            if number > high:
+                break
+            postings.append(self.postings[field][term])
+        return np.unique(np.concatenate(postings)) if postings else self.all[:0]
+
+
+class SyncedSearchIndex:
+    """SearchIndex over a CardStore that only answers once the catalog is complete
+
+    ``current`` returns None until a full sync of the store has completed,
+    so that searches go to the API instead of returning the few cards
+    looked up so far. When a later sync changes the catalog version, the
+    index is rebuilt on a background thread and swapped in; searches keep
+    using the previous index meanwhile.
+    """
+
+    def __init__(self, store, log=print):
+        self.store = store
+        self.log = log
+        self._lock = threading.Lock()
+        self._building = False
+        self._index = SearchIndex.from_store(store) if store.catalog_version() else None
+
+    def current(self) -> SearchIndex or None:
+        """Index of the latest complete catalog, None if there is none yet"""
+        version = self.store.catalog_version()
+        index = self._index
+        if version is not None and (index is None or index.version != version):
+            with self._lock:
+                if not self._building:
+                    self._building = True
+                    threading.Thread(target=self._rebuild, name="search-index", daemon=True).start()
+        return index
+
+    def suggest(self, prefix: str, limit: int = 10) -> list:
+        """Card name suggestions from the current index, none without one"""
+        index = self.current()
+        return index.suggest(prefix, limit) if index is not None else []
+
+    def _rebuild(self):
+        try:
+            # The store is read on this thread's own connection
+            self._index = SearchIndex.from_store(self.store)
+            self.log(f"Rebuilt the search index for catalog version {self._index.version}")
+        except Exception as e:
+            self.log(f"Failed to rebuild the search index: {e}")
+        finally:
+            with self._lock:
+                self._building = False
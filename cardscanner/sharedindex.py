@@ -0,0 +1,100 @@
+import fcntl
+import glob
+import hashlib
+import os
+import tempfile
+from contextlib import contextmanager
+
+from cardscanner import hashdb
+from cardscanner.hashindex import HashIndex
+
+# Snapshots live on tmpfs where available, so mapping them is mapping shared memory
+SHARED_DIR = os.environ.get(
+    "SHARED_INDEX_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+)
+
+
+def _snapshot_prefix(path: str, directory: str) -> str:
+    source = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(directory, f"cardscanner-{source}-")
+
+
+@contextmanager
+def _locked_snapshot(path: str, pickle_path: str, directory: str):
+    # Yields the snapshot path while holding the lock that guards removing it
+    signature = repr(hashdb.signature(path, pickle_path)).encode("utf-8")
+    prefix = _snapshot_prefix(path, directory)
+    snapshot = f"{prefix}{hashlib.sha1(signature).hexdigest()[:16]}.cardhash"
+
+    with open(f"{prefix}lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not os.path.exists(snapshot):
+            index = hashdb.load_index(path, pickle_path)
+            hashdb.write(
+                snapshot,
+                index.ids.tolist(),
+                index.matrices,
+                {"version": index.version, "source": os.path.basename(path)},
+            )
+            for old in glob.glob(f"{prefix}*.cardhash"):
+                if old != snapshot:
+                    os.remove(old)
+        yield snapshot
+
+
+def publish(
+    path: str = hashdb.DEFAULT_PATH,
+    pickle_path: str = hashdb.DEFAULT_PICKLE_PATH,
+    directory: str = SHARED_DIR,
+) -> str:
+    """Get a single memory-mappable file holding the whole hash index
+
+    A compacted hash database already is one, so its own path is returned.
+    A database with delta segments, or only the pickle, is built once into
+    a snapshot named after the files it was built from. Every process that
+    publishes the same files gets the same snapshot: the first one builds
+    it under a file lock and the others map it, so the index exists once
+    in memory however many workers there are. Older snapshots of the same
+    database are removed; processes that still map them keep their pages
+    until they unmap them.
+
+    The returned snapshot can be replaced by another process publishing
+    newer files as soon as this returns, use ``load_shared_index`` to map
+    it safely.
+
+    Args:
+        path (string): Hash database file
+        pickle_path (string): Pickled DataFrame used when the database doesn't exist
+        directory (string): Where snapshots are written
+    Returns:
+        string: Path of a hash database file without segments
+    """
+    if os.path.exists(path) and not hashdb.segment_paths(path):
+        return path
+    with _locked_snapshot(path, pickle_path, directory) as snapshot:
+        return snapshot
+
+
+def load_shared_index(
+    path: str = hashdb.DEFAULT_PATH,
+    pickle_path: str = hashdb.DEFAULT_PICKLE_PATH,
+    directory: str = SHARED_DIR,
+) -> HashIndex:
+    """Load the hash index by mapping its published snapshot read-only
+
+    Drop-in replacement for ``hashdb.load_index`` that keeps the matrices
+    out of the private memory of every worker process. The snapshot is
+    mapped while the lock is held, so no other process can remove it
+    between publishing and mapping.
+    """
+    if os.path.exists(path) and not hashdb.segment_paths(path):
+        return hashdb.HashDB(path).to_index()
+    with _locked_snapshot(path, pickle_path, directory) as snapshot:
+        return hashdb.HashDB(snapshot).to_index()
+
+
+def unpublish(path: str = hashdb.DEFAULT_PATH, directory: str = SHARED_DIR):
+    """Remove every snapshot of a hash database"""
+    prefix = _snapshot_prefix(path, directory)
+    for snapshot in glob.glob(f"{prefix}*"):
+        os.remove(snapshot)
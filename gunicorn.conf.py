@@ -0,0 +1,22 @@
+import os
+
+from cardscanner import sharedindex
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+timeout = 60
+
+
+def on_starting(server):
+    """Build the shared hash index snapshot once, before any worker starts
+
+    Workers then only map the snapshot, so startup time and memory don't
+    grow with the number of workers.
+    """
+    snapshot = sharedindex.publish()
+    server.log.info(f"Shared card hash index: {snapshot}")
+
+
+def on_exit(server):
+    sharedindex.unpublish()
@@ -0,0 +1,218 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode, urlparse
+
+# Seconds a response stays fresh, per API resource
+DEFAULT_TTLS = {
+    "cards": 6 * 60 * 60,
+    "sets": 24 * 60 * 60,
+    "types": 7 * 24 * 60 * 60,
+    "subtypes": 7 * 24 * 60 * 60,
+    "supertypes": 7 * 24 * 60 * 60,
+    "rarities": 7 * 24 * 60 * 60,
+}
+DEFAULT_TTL = 60 * 60
+
+# Seconds between two purges of the expired rows of a DiskCache
+DISK_PURGE_INTERVAL = 60 * 60
+
+
+class MemoryCache:
+    """In-memory LRU cache bounded by entry count and total utf-8 encoded bytes"""
+
+    def __init__(self, max_entries: int = 2048, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> str or None:
+        """Get a fresh value and mark it as recently used
+
+        Args:
+            key (string): Cache key
+        Returns:
+            string: Cached value, or None if missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value, _ = entry
+            if expires_at <= time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: float):
+        """Store a value, evicting least recently used entries if needed
+
+        Args:
+            key (string): Cache key
+            value (string): Value to store
+            ttl (float): Seconds the value stays fresh
+        """
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + ttl, value, size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self.bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+
+class DiskCache:
+    """SQLite backed cache that survives restarts
+
+    Expired rows are deleted by the first ``set`` after every
+    DISK_PURGE_INTERVAL seconds, so the file doesn't keep growing.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._purged_at = 0.0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, expires_at REAL NOT NULL, value TEXT NOT NULL)"
+            )
+
+    def get(self, key: str) -> tuple or None:
+        """Get a fresh value along with when it expires
+
+        Args:
+            key (string): Cache key
+        Returns:
+            tuple: (value, expiry as a time.time() timestamp), or None if
+            missing or expired
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def set(self, key: str, value: str, ttl: float):
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, expires_at, value) VALUES (?, ?, ?)",
+                (key, now + ttl, value),
+            )
+            if now - self._purged_at >= DISK_PURGE_INTERVAL:
+                self._connection.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+                self._purged_at = now
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM responses")
+
+
+class ResponseCache:
+    """Response cache for RestClient with per-resource TTLs
+
+    Responses are kept as JSON text in an in-memory LRU and, optionally,
+    in a DiskCache behind it. Every hit is parsed again, so callers never
+    share (and can't mutate) each other's response dicts.
+    """
+
+    def __init__(self, max_entries: int = 2048, max_bytes: int = 64 * 1024 * 1024,
+                 ttls: dict = None, default_ttl: float = DEFAULT_TTL, disk_path: str = None):
+        self.memory = MemoryCache(max_entries, max_bytes)
+        self.disk = DiskCache(disk_path) if disk_path else None
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._counters_lock = threading.Lock()
+
+    @staticmethod
+    def key(url: str, params: dict = None) -> str:
+        """Cache key of a request, independent of parameter order"""
+        return f"{url}?{urlencode(sorted((params or {}).items()))}"
+
+    def ttl(self, url: str) -> float:
+        """Seconds a response of the resource behind a URL stays fresh"""
+        parts = [part for part in urlparse(url).path.split("/") if part]
+        resource = parts[1] if len(parts) > 1 else None
+        return self.ttls.get(resource, self.default_ttl)
+
+    def get(self, url: str, params: dict = None) -> dict or None:
+        """Get a cached response
+
+        Args:
+            url (string): Request URL
+            params (dict): Request parameters
+        Returns:
+            dict: Parsed JSON response, or None on a miss
+        """
+        key = self.key(url, params)
+        value = self.memory.get(key)
+        if value is not None:
+            with self._counters_lock:
+                self.hits += 1
+            return json.loads(value)
+
+        if self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                with self._counters_lock:
+                    self.disk_hits += 1
+                # Only for what is left of the response's lifetime, not a fresh TTL
+                self.memory.set(key, value, expires_at - time.time())
+                return json.loads(value)
+
+        with self._counters_lock:
+            self.misses += 1
+        return None
+
+    def set(self, url: str, params: dict, value: str):
+        """Store the JSON text of a response
+
+        Args:
+            url (string): Request URL
+            params (dict): Request parameters
+            value (string): JSON response body
+        """
+        key = self.key(url, params)
+        ttl = self.ttl(url)
+        self.memory.set(key, value, ttl)
+        if self.disk is not None:
+            self.disk.set(key, value, ttl)
+
+    def stats(self) -> dict:
+        """Hit and miss counters and current memory usage"""
+        with self._counters_lock:
+            counters = {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses}
+        return dict(counters, entries=len(self.memory), bytes=self.memory.bytes)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
@@ -1,4 +1,4 @@
-from pokemontcgmanager.querybuilder import QueryBuilder
+from pokemontcgmanager.querybuilder import Page, QueryBuilder
 
 
 class Card:
@@ -25,3 +25,54 @@ class Card:
             list of dict: List of dictionaries containing card data
         """
         return QueryBuilder(Card).where(**kwargs)
+
+    @staticmethod
+    def page(page: int = 1, page_size: int = 250, prefetch: bool = False, **kwargs) -> Page:
+        """Get one page of cards along with the total number of results
+
+        Args:
+            page (int): Page number
+            page_size (int): Cards per page
+            prefetch (bool): Fetch the adjacent pages in the background
+            **kwargs: Dictionary of query parameters
+        Returns:
+            Page: List of dictionaries containing card data, with paging metadata
+        """
+        query = QueryBuilder(Card)
+        query.params.update(kwargs)
+        return query.page(page, page_size, prefetch)
+
+    @staticmethod
+    def where_pages(**kwargs):
+        """Query cards and page through the results, fetching pages concurrently
+
+        Args:
+            **kwargs: Dictionary of query parameters
+        Returns:
+            generator of list of dict: Pages of card data, in order
+        """
+        return QueryBuilder(Card).where_pages(**kwargs)
+
+    @staticmethod
+    def find_many(ids: list[str]) -> list[dict or None]:
+        """Get several cards by id concurrently
+
+        Args:
+            ids (list of string): Card ids
+        Returns:
+            list of dict: Card data in the order of ids, None for cards that
+            could not be fetched
+        """
+        return QueryBuilder(Card).find_many(ids)
+
+    @staticmethod
+    async def find_many_async(ids: list[str]) -> list[dict or None]:
+        """Get several cards by id concurrently from async code
+
+        Args:
+            ids (list of string): Card ids
+        Returns:
+            list of dict: Card data in the order of ids, None for cards that
+            could not be fetched
+        """
+        return await QueryBuilder(Card).find_many_async(ids)
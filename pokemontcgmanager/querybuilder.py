@@ -1,7 +1,50 @@
+import asyncio
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
 from pokemontcgmanager.restclient import RestClient
 
 BASE_URL = "https://api.pokemontcg.io/v2/"
 
+# Most requests a fan-out keeps in flight at once
+MAX_IN_FLIGHT = 8
+
+# Background threads that warm the response cache with adjacent pages
+_prefetch_executor = None
+_prefetch_lock = threading.Lock()
+
+
+def _prefetcher() -> ThreadPoolExecutor:
+    global _prefetch_executor
+    if _prefetch_executor is None:
+        with _prefetch_lock:
+            if _prefetch_executor is None:
+                _prefetch_executor = ThreadPoolExecutor(2, thread_name_prefix="page-prefetch")
+    return _prefetch_executor
+
+
+class Page(list):
+    """One page of resources along with the paging metadata of the response"""
+
+    def __init__(self, data: list, page: int, page_size: int, total_count: int):
+        super().__init__(data)
+        self.page = page
+        self.page_size = page_size
+        self.total_count = total_count
+
+    @property
+    def total_pages(self) -> int:
+        return -(-self.total_count // self.page_size) if self.page_size else 0
+
+    @property
+    def last_page(self) -> bool:
+        """Whether there are no results after this page"""
+        return self.page >= self.total_pages
+
 
 class QueryBuilder:
     def __init__(self, type):
@@ -20,6 +63,64 @@ class QueryBuilder:
         response = RestClient.get(url)["data"]
         return response
 
+    def find_many(self, ids, max_in_flight: int = MAX_IN_FLIGHT) -> list:
+        """Get several resources by id concurrently
+
+        Args:
+            ids (list of string): Resource ids
+            max_in_flight (int): Most requests sent at the same time
+        Returns:
+            list of object: Resources in the order of ids, None where the
+            request failed
+        """
+        ids = list(ids)
+        if len(ids) <= 1:
+            return [self._find_or_none(id) for id in ids]
+        with ThreadPoolExecutor(min(max_in_flight, len(ids))) as executor:
+            return list(executor.map(self._find_or_none, ids))
+
+    def _find_or_none(self, id: str):
+        try:
+            return self.find(id)
+        except requests.RequestException:
+            return None
+
+    async def find_async(self, id: str):
+        """Get a resource by its id without blocking the event loop
+
+        Args:
+            id (string): Resource id
+        Returns:
+            object: Instance of the resource type
+        """
+        return await asyncio.to_thread(self.find, id)
+
+    async def find_many_async(self, ids, max_in_flight: int = MAX_IN_FLIGHT) -> list:
+        """Get several resources by id concurrently from async code
+
+        Args:
+            ids (list of string): Resource ids
+            max_in_flight (int): Most requests sent at the same time
+        Returns:
+            list of object: Resources in the order of ids, None where the
+            request failed
+        """
+        semaphore = asyncio.Semaphore(max_in_flight)
+
+        async def fetch(id):
+            async with semaphore:
+                return await asyncio.to_thread(self._find_or_none, id)
+
+        return await asyncio.gather(*(fetch(id) for id in ids))
+
+    async def all_async(self):
+        """Get all resources without blocking the event loop
+
+        Returns:
+            list of object: List of resource objects
+        """
+        return await asyncio.to_thread(self.all)
+
     def where(self, **kwargs):
         """Adds a parameter to the dictionary of query parameters
 
@@ -31,33 +132,117 @@ class QueryBuilder:
         for key, value in kwargs.items():
             self.params[key] = value
 
+        if "page" in self.params:
+            return self.page()
         return self.all()
 
-    def all(self):
-        """Get all resources, automatically paging through data
+    def page(self, page: int = None, page_size: int = None, prefetch: bool = False) -> Page:
+        """Get a single page of resources with its paging metadata
 
+        Args:
+            page (int): Page number, defaults to the 'page' parameter or 1
+            page_size (int): Page size, defaults to the 'pageSize' parameter or 250
+            prefetch (bool): Fetch the adjacent pages in the background, so
+                they are served from the RestClient cache when requested
         Returns:
-            list of object: List of resource objects
+            Page: Resource objects of the page
+        """
+        url = f"{BASE_URL}/{self.type.RESOURCE}"
+        page = int(page if page is not None else self.params.get("page", 1))
+        page_size = int(page_size if page_size is not None else self.params.get("pageSize", 250))
+        params = dict(self.params, page=page, pageSize=page_size)
+
+        response = RestClient.get(url, params)
+        data = response["data"]
+        result = Page(
+            data,
+            response.get("page", page),
+            response.get("pageSize", page_size),
+            response.get("totalCount", (page - 1) * page_size + len(data)),
+        )
+
+        if prefetch and RestClient.cache is not None:
+            adjacent = [p for p in (page + 1, page - 1) if 1 <= p <= result.total_pages]
+            for p in adjacent:
+                _prefetcher().submit(RestClient.get, url, dict(params, page=p))
+        return result
+
+    def where_pages(self, **kwargs):
+        """Adds parameters to the query and pages through the results
+
+        Args:
+            **kwargs: Arbitrary keyword arguments.
+        Returns:
+            generator of list: Pages of resource objects, in order
+        """
+        for key, value in kwargs.items():
+            self.params[key] = value
+
+        return self.iter_pages()
+
+    def iter_pages(self, max_in_flight: int = MAX_IN_FLIGHT):
+        """Page through resources, fetching later pages concurrently
+
+        The first page tells how many results there are in total; the
+        remaining pages are then fetched on a bounded thread pool and
+        yielded in order as they arrive. Only a fixed window of pages is
+        held in memory at any time.
+
+        Args:
+            max_in_flight (int): Most page requests sent at the same time
+        Returns:
+            generator of list: Pages of resource objects
         """
-        data_list = []
-        fetch_all = True
         url = f"{BASE_URL}/{self.type.RESOURCE}"
 
         if "page" in self.params:
-            fetch_all = False
-        else:
-            self.params["page"] = 1
-
-        while True:
-            response = RestClient.get(url, self.params)["data"]
-            if len(response) > 0:
-                data_list.extend(response)
-
-                if fetch_all:
-                    self.params["page"] += 1
-                else:
-                    break
-            else:
-                break
-
-        return data_list
+            yield RestClient.get(url, self.params)["data"]
+            return
+
+        params = dict(self.params, page=1)
+        first = RestClient.get(url, params)
+        data = first["data"]
+        if len(data) == 0:
+            return
+        yield data
+
+        # Endpoints without paging metadata return everything in one response
+        total_count = first.get("totalCount")
+        page_size = first.get("pageSize") or len(data)
+        if total_count is None:
+            return
+        last_page = -(-total_count // page_size)
+
+        pages = iter(range(2, last_page + 1))
+        window = deque()
+        with ThreadPoolExecutor(max_in_flight) as executor:
+            try:
+                for page in itertools.islice(pages, max_in_flight):
+                    window.append(executor.submit(RestClient.get, url, dict(params, page=page)))
+                while window:
+                    data = window.popleft().result()["data"]
+                    for page in itertools.islice(pages, 1):
+                        window.append(executor.submit(RestClient.get, url, dict(params, page=page)))
+                    if len(data) == 0:
+                        break
+                    yield data
+            finally:
+                for future in window:
+                    future.cancel()
+
+    def iter_all(self):
+        """Iterate over all resources without keeping them all in memory
+
+        Returns:
+            generator of object: Resource objects
+        """
+        for page in self.iter_pages():
+            yield from page
+
+    def all(self):
+        """Get all resources, automatically paging through data
+
+        Returns:
+            list of object: List of resource objects
+        """
+        return list(self.iter_all())
@@ -1,16 +1,126 @@
 import dotenv
 import os
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 dotenv.load_dotenv()
 
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
 
 class RestClient:
     api_key = None
+    cache = None
+    pool_size = 10
+    retries = 3
+    backoff_factor = 0.5
+    # (connect, read) timeout in seconds for every request
+    timeout = (3.05, 15)
+
+    _session = None
+    _download_session = None
+    _session_lock = threading.Lock()
 
     @classmethod
-    def configure(cls, api_key: str = None):
-        cls.api_key = api_key
+    def configure(
+        cls,
+        api_key: str = None,
+        cache=None,
+        pool_size: int = None,
+        retries: int = None,
+        backoff_factor: float = None,
+        timeout: tuple = None,
+    ):
+        """Configure the client
+
+        Only the settings that are passed change, the others keep their
+        current values.
+
+        Args:
+            api_key (string): Pokemon TCG API key, defaults to POKEMONTCG_API_KEY
+            cache (ResponseCache): Optional cache for GET responses
+            pool_size (int): Keep-alive connections kept open to the API
+            retries (int): Retries on connection errors, 429 and 5xx responses
+            backoff_factor (float): Exponential backoff between retries, in seconds
+            timeout (float or tuple): Request timeout, or (connect, read) timeouts
+        """
+        settings = {
+            "api_key": api_key,
+            "cache": cache,
+            "pool_size": pool_size,
+            "retries": retries,
+            "backoff_factor": backoff_factor,
+            "timeout": timeout,
+        }
+        for name, value in settings.items():
+            if value is not None:
+                setattr(cls, name, value)
+        with cls._session_lock:
+            for session in (cls._session, cls._download_session):
+                if session is not None:
+                    session.close()
+            cls._session = None
+            cls._download_session = None
+
+    @classmethod
+    def _new_session(cls, api_key: str = None) -> requests.Session:
+        retry = Retry(
+            total=cls.retries,
+            backoff_factor=cls.backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(["GET"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=cls.pool_size,
+            pool_maxsize=cls.pool_size,
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+        session.headers["User-Agent"] = "Mozilla/5.0"
+        if api_key:
+            session.headers["X-Api-Key"] = api_key
+        return session
+
+    @classmethod
+    def session(cls) -> requests.Session:
+        """Get the shared keep-alive session, creating it on first use
+
+        Returns:
+            requests.Session: Pooled session with retries and default headers
+        """
+        if cls._session is None:
+            with cls._session_lock:
+                if cls._session is None:
+                    api_key = (
+                        cls.api_key
+                        if cls.api_key is not None
+                        else os.getenv("POKEMONTCG_API_KEY")
+                    )
+                    cls._session = cls._new_session(api_key)
+        return cls._session
+
+    @classmethod
+    def download_session(cls) -> requests.Session:
+        """Get the shared keep-alive session for other hosts, e.g. the image CDN
+
+        Same pooling and retries as ``session``, but without the API key,
+        which must only ever be sent to the API.
+
+        Returns:
+            requests.Session: Pooled session with retries and default headers
+        """
+        if cls._download_session is None:
+            with cls._session_lock:
+                if cls._download_session is None:
+                    cls._download_session = cls._new_session()
+        return cls._download_session
 
     @classmethod
     def get(cls, url: str, params: dict = {}) -> dict or None:
@@ -24,13 +134,13 @@ class RestClient:
         """
         request_url = url
 
-        headers = {"User-Agent": "Mozilla/5.0"}
-        api_key = (
-            cls.api_key if cls.api_key is not None else os.getenv("POKEMONTCG_API_KEY")
-        )
-        if api_key:
-            headers["X-Api-Key"] = api_key
+        if cls.cache is not None:
+            cached = cls.cache.get(request_url, params)
+            if cached is not None:
+                return cached
 
-        response = requests.get(request_url, params=params, headers=headers)
+        response = cls.session().get(request_url, params=params, timeout=cls.timeout)
         response.raise_for_status()
+        if cls.cache is not None:
+            cls.cache.set(request_url, params, response.text)
         return response.json()